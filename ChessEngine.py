@@ -3,6 +3,60 @@
 # ? determining a valid move at a current state
 # ? keep a move log (for undos)
 
+import random
+from array import array
+import chessMoveCache
+from chessEval import PST_MG, PST_EG, PHASE, taper, evaluateBoard
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+# ? packed moves: start square | end square << 6 | flag << 12, squares are row*8 + col
+# * 16 bits, so move lists fit an array('H') and a move is a plain int in the search
+MOVE_NORMAL = 0
+MOVE_DOUBLE_PUSH = 1
+MOVE_CASTLE = 2
+MOVE_ENPASSANT = 3
+MOVE_PROMOTION = 4  # * 4 to 7 promote to PROMOTION_PIECES[flag - 4]
+PROMOTION_PIECES = "NBRQ"
+NULL_MOVE = 0  # * a8 to a8 (square 0), never a real move: the side to move passes, only the search does this
+
+# ? zobrist keys: a random 64 bit number for every piece on every square, the side to move,
+# ? each castling rights combination and each en passant file, xor-ed together into one position key
+# * fixed seed so every process (and anything saved to disk) agrees on the keys
+_zobristRandom = random.Random(20210601)
+ZOBRIST_PIECES = {color + type: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for color in "wb" for type in "PNBRQK"}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+MOVE_CACHE_SIZE = 1 << 16  # * legal move lists remembered per GameState, 0 turns the cache off
+
+# ? undo records: everything a move destroys, packed into one int per move
+# * captured piece | castling bits << 4 | en passant square << 8 | halfmove clock << 15 | phase << 31 |
+# * middlegame score << 38 | endgame score << 58, the scores offset so they are never negative
+PIECE_CODES = ("--", "wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+PIECE_CODE_INDEX = {piece: i for i, piece in enumerate(PIECE_CODES)}
+NO_ENPASSANT = 64
+ENPASSANT_SQUARES = tuple((sq >> 3, sq & 7) for sq in range(64)) + ((),)  # * square -> enpassantPossible
+EVAL_OFFSET = 1 << 19
+
+
+def packMove(startSq, endSq, flag=MOVE_NORMAL):
+    return startSq | endSq << 6 | flag << 12
+
+
+def castlingIndex(castleRights):
+    return castleRights.wks | castleRights.bks << 1 | castleRights.wqs << 2 | castleRights.bqs << 3
+
+
 class GameState():
     def __init__(self):
         # * board is 8*8 2d array
@@ -21,233 +75,585 @@ class GameState():
         self.moveFunctions = {'P': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
                               'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves, }
         self.whiteToMove = True
-        self.movelog = []
+        self.movelog = []  # * packed moves
+        self.undoLog = []  # * packed undo record of each move in movelog
         self.whiteKingLocation = (7, 4)
         self.blackKingLocation = (0, 4)
         self.checkMate = False
         self.staleMate = False
         self.enpassantPossible = ()  # * possition of piece if en passaant is possible
         self.currentCasltingRight = CastlingRights(True, True, True, True)
-        self.castleRightsLog = [CastlingRights(
-            self.currentCasltingRight.wks, self.currentCasltingRight.bks, self.currentCasltingRight.wqs, self.currentCasltingRight.bqs)]
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.zobristKey = self.computeZobristKey()
+        self.zobristLog = [self.zobristKey]  # * key of every position in the game, beside movelog
+        self.startFen = START_FEN  # * position movelog starts from, replaying the moves on it gives zobristLog back
+        # * material + piece-square scores (white minus black) for the middlegame and endgame, and the game phase
+        self.mgScore, self.egScore, self.phase = evaluateBoard(self.board)
+        self.halfmoveClock = 0  # * plies since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1  # * starts at 1 and goes up after every black move
+        # * a key always means the same legal moves, so the cache survives loadFen
+        self.moveCache = chessMoveCache.MoveCache(MOVE_CACHE_SIZE) if MOVE_CACHE_SIZE else None
+
+    # ? new game state set up from a FEN string, e.g. GameState.fromFen(START_FEN)
+    @classmethod
+    def fromFen(cls, fen):
+        gs = cls()
+        gs.loadFen(fen)
+        return gs
+
+    # ? replace the position with the one in fen, the move log starts over from it
+    def loadFen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4 or len(fields) > 6:
+            raise ValueError("FEN needs 4 to 6 fields: " + fen)
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fields[0])
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                if char in "12345678":
+                    row.extend(["--"] * int(char))
+                elif char.upper() in "PNBRQK":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError("bad piece in FEN: " + char)
+            if len(row) != 8:
+                raise ValueError("FEN rank needs 8 squares: " + rank)
+            board.append(row)
+        if "wP" in board[0] + board[7] or "bP" in board[0] + board[7]:
+            raise ValueError("FEN has a pawn on the first or last rank: " + fields[0])
+        kings = [(board[r][c], (r, c)) for r in range(8) for c in range(8) if board[r][c][1] == "K"]
+        if sorted(piece for piece, _ in kings) != ["bK", "wK"]:
+            raise ValueError("FEN needs one king of each color: " + fields[0])
+        kings = dict(kings)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fields[1])
+        if fields[2] != "-" and (not fields[2] or any(char not in "KQkq" for char in fields[2])):
+            raise ValueError("bad FEN castling rights: " + fields[2])
+        if fields[3] != "-" and (len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or
+                                 fields[3][1] != ("6" if fields[1] == "w" else "3")):
+            raise ValueError("bad FEN en passant square: " + fields[3])
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("bad FEN move counters: " + " ".join(fields[4:]))
+        if halfmoveClock < 0 or fullmoveNumber < 1:
+            raise ValueError("bad FEN move counters: " + " ".join(fields[4:]))
+
+        self.board = board
+        self.whiteKingLocation = kings["wK"]
+        self.blackKingLocation = kings["bK"]
+        self.whiteToMove = fields[1] == "w"
+        # * a right whose king or rook has left its square is dropped, castling would move a missing piece
+        self.currentCasltingRight = CastlingRights(
+            "K" in fields[2] and board[7][4] == "wK" and board[7][7] == "wR",
+            "k" in fields[2] and board[0][4] == "bK" and board[0][7] == "bR",
+            "Q" in fields[2] and board[7][4] == "wK" and board[7][0] == "wR",
+            "q" in fields[2] and board[0][4] == "bK" and board[0][0] == "bR")
+        if fields[3] != "-":
+            self.enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        else:
+            self.enpassantPossible = ()
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+
+        self.startFen = " ".join(fields)
+        self.movelog = []
+        self.undoLog = []
+        self.checkMate = False
+        self.staleMate = False
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.zobristKey = self.computeZobristKey()
+        self.zobristLog = [self.zobristKey]
+        self.mgScore, self.egScore, self.phase = evaluateBoard(self.board)
+
+    # ? FEN string of the current position
+    def toFen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+        rights = self.currentCasltingRight
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+            ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+        if self.enpassantPossible != ():
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = "-"
+        return " ".join(("/".join(ranks), "w" if self.whiteToMove else "b", castling or "-", enpassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+    # ? static evaluation in centipawns from white's point of view, kept up to date by makeMove/undoMove
+    def getEvaluation(self):
+        return taper(self.mgScore, self.egScore, self.phase)
+
+    # ? how many times the current position has been on the board, counting this time
+    # * only positions since the last capture or pawn move can match, and only with the same side to move
+    def repetitionCount(self):
+        log = self.zobristLog
+        key = self.zobristKey
+        count = 1
+        for i in range(len(log) - 5, max(len(log) - 1 - self.halfmoveClock, 0) - 1, -2):
+            if log[i] == key:
+                count += 1
+        return count
+
+    # ? the position was already on the board, the search scores the first repetition as a draw
+    def isRepetition(self):
+        log = self.zobristLog
+        key = self.zobristKey
+        for i in range(len(log) - 5, max(len(log) - 1 - self.halfmoveClock, 0) - 1, -2):
+            if log[i] == key:
+                return True
+        return False
 
-    # * wont work with castling, pawn promotion, en-passant
+    # ? fifty moves by each side without a capture or a pawn move
+    def isFiftyMoveDraw(self):
+        return self.halfmoveClock >= 100
+
+    # ? neither side can ever mate: bare kings, a single minor piece, or bishops all on one square color
+    def isInsufficientMaterial(self):
+        minors = []
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece == "--" or piece[1] == "K":
+                    continue
+                if piece[1] in "PRQ":
+                    return False
+                minors.append((piece[1], (r + c) % 2))
+        if len(minors) <= 1:
+            return True
+        return all(type == "B" and color == minors[0][1] for type, color in minors)
+
+    # ? why the game is drawn by rule, None when it is not
+    def getDrawReason(self):
+        if self.isInsufficientMaterial():
+            return "insufficient material"
+        if self.isFiftyMoveDraw():
+            return "fifty move rule"
+        if self.repetitionCount() >= 3:
+            return "threefold repetition"
+        return None
+
+    # ? hash the whole position from scratch, makeMove/undoMove keep zobristKey up to date incrementally
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key ^ ZOBRIST_CASTLING[castlingIndex(self.currentCasltingRight)] ^ self.enpassantKey()
+
+    # * the en passant file only counts when the side to move has a pawn that can make the capture,
+    # * otherwise the same position would get two keys
+    def enpassantKey(self):
+        if self.enpassantPossible == ():
+            return 0
+        r, c = self.enpassantPossible
+        pawnRow, pawn = (r + 1, "wP") if self.whiteToMove else (r - 1, "bP")
+        if (c > 0 and self.board[pawnRow][c-1] == pawn) or (c < 7 and self.board[pawnRow][c+1] == pawn):
+            return ZOBRIST_ENPASSANT[c]
+        return 0
+
+    # ? make a Move object (from the UI), the engine itself works on packed moves
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMove
+        self.makePackedMove(move.packed)
+
+    def makePackedMove(self, move):
+        board = self.board
+        startSq = move & 63
+        endSq = (move >> 6) & 63
+        flag = move >> 12
+        startRow, startCol = startSq >> 3, startSq & 7
+        endRow, endCol = endSq >> 3, endSq & 7
+        pieceMove = board[startRow][startCol]
+        if flag == MOVE_ENPASSANT:
+            pieceCaptured = board[startRow][endCol]
+        else:
+            pieceCaptured = board[endRow][endCol]
+        placed = pieceMove[0] + PROMOTION_PIECES[flag - MOVE_PROMOTION] if flag >= MOVE_PROMOTION else pieceMove
+
+        # * everything undoMove cannot work out from the move itself
+        castling = castlingIndex(self.currentCasltingRight)
+        enpassant = self.enpassantPossible
+        self.undoLog.append(PIECE_CODE_INDEX[pieceCaptured] | castling << 4 |
+                            (enpassant[0] * 8 + enpassant[1] if enpassant != () else NO_ENPASSANT) << 8 |
+                            min(max(0, self.halfmoveClock), 0xFFFF) << 15 | self.phase << 31 |
+                            (self.mgScore + EVAL_OFFSET) << 38 | (self.egScore + EVAL_OFFSET) << 58)
+
+        # * take the old castling rights, en passant file and side to move out of the key
+        key = self.zobristKey ^ ZOBRIST_CASTLING[castling] ^ self.enpassantKey() ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[pieceMove][startSq] ^ ZOBRIST_PIECES[placed][endSq]
+        mgScore = self.mgScore - PST_MG[pieceMove][startSq] + PST_MG[placed][endSq]
+        egScore = self.egScore - PST_EG[pieceMove][startSq] + PST_EG[placed][endSq]
+        phase = self.phase + PHASE[placed] - PHASE[pieceMove]  # * only changes on promotion
+        if pieceCaptured != "--":
+            capturedSq = startRow * 8 + endCol if flag == MOVE_ENPASSANT else endSq
+            key ^= ZOBRIST_PIECES[pieceCaptured][capturedSq]
+            mgScore -= PST_MG[pieceCaptured][capturedSq]
+            egScore -= PST_EG[pieceCaptured][capturedSq]
+            phase -= PHASE[pieceCaptured]
+
+        board[startRow][startCol] = "--"
+        board[endRow][endCol] = placed
         self.movelog.append(move)  # *log the move to undo later
         self.whiteToMove = not self.whiteToMove  # * change tern
         # * update kings location if moved
-        if move.pieceMove == "wK":
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        elif move.pieceMove == "bK":
-            self.blackKingLocation = (move.endRow, move.endCol)
-
-        # * pawn promotion
-        if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMove[0]+"Q"
+        if pieceMove == "wK":
+            self.whiteKingLocation = (endRow, endCol)
+        elif pieceMove == "bK":
+            self.blackKingLocation = (endRow, endCol)
 
         # * En passant
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = "--"  # * capture the pawn
+        if flag == MOVE_ENPASSANT:
+            board[startRow][endCol] = "--"  # * capture the pawn
         # *update enpassantpossible varialble
         # * only on 2 square pawn advance
-        if move.pieceMove[1] == "P" and abs(move.startRow - move.endRow) == 2:
-            self.enpassantPossible = (
-                (move.startRow + move.endRow)//2, move.endCol)
+        if flag == MOVE_DOUBLE_PUSH:
+            self.enpassantPossible = ((startRow + endRow)//2, endCol)
         else:
             self.enpassantPossible = ()
 
         # * Castle Move
-        if move.isCastleMove:
-            if (move.endCol - move.startCol) == 2:  # * king side castle
-                self.board[move.endRow][move.endCol -
-                                        1] = self.board[move.endRow][move.endCol+1]
-                self.board[move.endRow][move.endCol + 1] = "--"
+        if flag == MOVE_CASTLE:
+            rook = pieceMove[0] + "R"
+            if (endCol - startCol) == 2:  # * king side castle
+                board[endRow][endCol - 1] = board[endRow][endCol + 1]
+                board[endRow][endCol + 1] = "--"
+                rookFrom, rookTo = endSq + 1, endSq - 1
             else:  # * Queen side Castle
-                self.board[move.endRow][move.endCol +
-                                        1] = self.board[move.endRow][move.endCol-2]
-                self.board[move.endRow][move.endCol - 2] = "--"
+                board[endRow][endCol + 1] = board[endRow][endCol - 2]
+                board[endRow][endCol - 2] = "--"
+                rookFrom, rookTo = endSq - 2, endSq + 1
+            key ^= ZOBRIST_PIECES[rook][rookFrom] ^ ZOBRIST_PIECES[rook][rookTo]
+            mgScore += PST_MG[rook][rookTo] - PST_MG[rook][rookFrom]
+            egScore += PST_EG[rook][rookTo] - PST_EG[rook][rookFrom]
 
         # * update castling rights-> when a rook or a king move
-        self.updateCastlRights(move)
-        self.castleRightsLog.append(CastlingRights(
-            self.currentCasltingRight.wks, self.currentCasltingRight.bks, self.currentCasltingRight.wqs, self.currentCasltingRight.bqs))
+        self.updateCastlRights(pieceMove, pieceCaptured, startSq, endSq)
+
+        # * put the new castling rights and en passant file back in
+        self.zobristKey = key ^ ZOBRIST_CASTLING[castlingIndex(self.currentCasltingRight)] ^ self.enpassantKey()
+        self.zobristLog.append(self.zobristKey)
+        self.mgScore, self.egScore, self.phase = mgScore, egScore, phase
+        if pieceMove[1] == "P" or pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if pieceMove[0] == "b":
+            self.fullmoveNumber += 1
+
+    # ? pass the turn without moving, for null move pruning; undoMove takes it back like any move
+    def makeNullMove(self):
+        enpassant = self.enpassantPossible
+        self.undoLog.append((enpassant[0] * 8 + enpassant[1] if enpassant != () else NO_ENPASSANT) << 8 |
+                            min(max(0, self.halfmoveClock), 0xFFFF) << 15)
+        self.zobristKey ^= self.enpassantKey() ^ ZOBRIST_BLACK_TO_MOVE
+        self.enpassantPossible = ()
+        self.whiteToMove = not self.whiteToMove
+        self.halfmoveClock = 0  # * a repetition never reaches back over a null move
+        self.movelog.append(NULL_MOVE)
+        self.zobristLog.append(self.zobristKey)
 
     def undoMove(self):
         if len(self.movelog) != 0:
+            board = self.board
             move = self.movelog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMove
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            record = self.undoLog.pop()
+            if move == NULL_MOVE:
+                self.whiteToMove = not self.whiteToMove
+                self.enpassantPossible = ENPASSANT_SQUARES[(record >> 8) & 127]
+                self.halfmoveClock = (record >> 15) & 0xFFFF
+                self.zobristLog.pop()
+                self.zobristKey = self.zobristLog[-1]
+                return
+            pieceCaptured = PIECE_CODES[record & 15]
+            startSq = move & 63
+            endSq = (move >> 6) & 63
+            flag = move >> 12
+            startRow, startCol = startSq >> 3, startSq & 7
+            endRow, endCol = endSq >> 3, endSq & 7
+            pieceMove = board[endRow][endCol]
+            if flag >= MOVE_PROMOTION:
+                pieceMove = pieceMove[0] + "P"
+            board[startRow][startCol] = pieceMove
+            board[endRow][endCol] = pieceCaptured
             self.whiteToMove = not self.whiteToMove
             # * update kings location if moved
-            if move.pieceMove == "wK":
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            if move.pieceMove == "bK":
-                self.blackKingLocation = (move.startRow, move.startCol)
+            if pieceMove == "wK":
+                self.whiteKingLocation = (startRow, startCol)
+            elif pieceMove == "bK":
+                self.blackKingLocation = (startRow, startCol)
             # * undo en passant move
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # * undo  2 square pawn advance
-            if move.pieceMove[1] == "P" and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
-            # * undoing castling rights
-            self.castleRightsLog.pop()
-            self.currentCasltingRight = self.castleRightsLog[-1]
-
-            if move.isCastleMove:
-                if (move.endCol - move.startCol) == 2:
-                    self.board[move.endRow][move.endCol +
-                                            1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = "--"
+            if flag == MOVE_ENPASSANT:
+                board[endRow][endCol] = "--"
+                board[startRow][endCol] = pieceCaptured
+            # * restore the en passant square, castling rights, clock and scores of the previous position
+            self.enpassantPossible = ENPASSANT_SQUARES[(record >> 8) & 127]
+            rights = self.currentCasltingRight
+            rights.wks = bool(record & 16)
+            rights.bks = bool(record & 32)
+            rights.wqs = bool(record & 64)
+            rights.bqs = bool(record & 128)
+            self.halfmoveClock = (record >> 15) & 0xFFFF
+            self.phase = (record >> 31) & 127
+            self.mgScore = ((record >> 38) & 0xFFFFF) - EVAL_OFFSET
+            self.egScore = (record >> 58) - EVAL_OFFSET
+            self.zobristLog.pop()
+            self.zobristKey = self.zobristLog[-1]
+            if pieceMove[0] == "b":
+                self.fullmoveNumber -= 1
+
+            if flag == MOVE_CASTLE:
+                if (endCol - startCol) == 2:
+                    board[endRow][endCol + 1] = board[endRow][endCol - 1]
+                    board[endRow][endCol - 1] = "--"
                 else:
-                    self.board[move.endRow][move.endCol - 2
-                                            ] = self.board[move.endRow][move.endCol+1]
-                    self.board[move.endRow][move.endCol + 1] = "--"
+                    board[endRow][endCol - 2] = board[endRow][endCol + 1]
+                    board[endRow][endCol + 1] = "--"
             self.checkMate = False
             self.staleMate = False
 
     # *update the castling right give a move
-    def updateCastlRights(self, move):
-        if move.pieceMove == "wK":
+    def updateCastlRights(self, pieceMove, pieceCaptured, startSq, endSq):
+        if pieceMove == "wK":
             self.currentCasltingRight.wks = False
             self.currentCasltingRight.wqs = False
-        elif move.pieceMove == "bK":
+        elif pieceMove == "bK":
             self.currentCasltingRight.bks = False
             self.currentCasltingRight.bqs = False
-        elif move.pieceMove == "wR" or move.pieceCaptured == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0:
-                    self.currentCasltingRight.wqs = False
-                elif move.startCol == 7:
-                    self.currentCasltingRight.wks = False
-        elif move.pieceMove == "bR" or move.pieceCaptured == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0:
-                    self.currentCasltingRight.bqs = False
-                elif move.startCol == 7:
-                    self.currentCasltingRight.bks = False
-
-    # ? get all possible moves considering checks -> advanced
-    #! Bugged (getValidMovesA & checkForPinsAndChecks)
-    # TODO FIX later
-    # def getValidMovesA(self):
-    #     moves = []
-    #     self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
-    #     if self.whiteToMove:
-    #         kingRow = self.whiteKingLocation[0]
-    #         kingCol = self.whiteKingLocation[1]
-    #     else:
-    #         kingRow = self.blackKingLocation[0]
-    #         kingCol = self.blackKingLocation[1]
-    #     if self.inCheck:
-    #         if len(self.checks) == 1:  # * ther is on check, block check, or move king
-    #             moves = self.getAllPossibleMoves()
-    #             check = self.checks[0]
-    #             checkRow = check[0]
-    #             checkCol = check[1]
-    #             pieceChecking = self.board[checkRow][checkCol]
-    #             validSquares = []
-    #             if pieceChecking[1] == 'N':
-    #                 validSquares = [(checkRow, checkCol)]
-    #             else:
-    #                 for i in range(1, 8):
-    #                     validSquare = (
-    #                         kingRow + check[2]*i, kingCol + check[3]*i)
-    #                     validSquares.append(validSquare)
-    #                     if validSquare[0] == checkRow and validSquare[1] == checkCol:
-    #                         break
-    #             for i in range(len(moves)-1, -1, -1):
-    #                 if moves[i].pieceMove[1] != "K":
-    #                     if not (moves[i].endRow, moves[i].endCol) in validSquares:
-    #                         moves.remove(moves[i])
-    #         else:
-    #             self.getKingMoves(kingRow, kingCol, moves)
-    #     else:
-    #         moves = self.getAllPossibleMoves()
-    #     return moves
-
-    # def checkForPinsAndChecks(self):
-    #     pins = []
-    #     checks = []
-    #     inCheck = False
-    #     if self.whiteToMove:
-    #         enemyColor = "b"
-    #         allyColor = "w"
-    #         startRow = self.whiteKingLocation[0]
-    #         startCol = self.whiteKingLocation[1]
-    #     else:
-    #         enemyColor = "w"
-    #         allyColor = "b"
-    #         startRow = self.blackKingLocation[0]
-    #         startCol = self.blackKingLocation[1]
-    #     directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
-    #                   (-1, -1), (-1, 1), (1, -1), (1, 1))
-    #     for j in range(len(directions)):
-    #         d = directions[j]
-    #         possiblePin = ()
-    #         for i in range(1, 8):
-    #             endRow = startRow + d[0] * i
-    #             endCol = startCol + d[1] * i
-    #             if 0 <= endRow < 8 and 0 <= endCol < 8:
-    #                 endPiece = self.board[endRow][endCol]
-    #                 if endPiece[0] == allyColor:
-    #                     if possiblePin == ():
-    #                         possiblePin = (endRow, endCol, d[0], d[1])
-    #                     else:
-    #                         break
-    #                 elif endPiece[0] == enemyColor:
-    #                     type = endPiece[1]
-    #                     if(0 <= j <= 3 and type == "R") or (4 <= j <= 7 and type == "B") or (i == 1 and type == "P" and ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or (type == "Q") or (i == 1 and type == "K"):
-    #                         if possiblePin == ():
-    #                             inCheck = True
-    #                             checks.append((endRow, endCol, d[0], d[1]))
-    #                             break
-    #                         else:
-    #                             pins.append(possiblePin)
-    #                             break
-    #                     else:
-    #                         break
-    #             else:
-    #                 break
-    #     knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, -2),
-    #                    (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-    #     for m in knightMoves:
-    #         endRow = startRow + m[0]
-    #         endCol = startCol + m[1]
-    #         if 0 <= endRow < 8 and 0 <= endCol < 8:
-    #             endPiece = self.board[endRow][endCol]
-    #             if endPiece[0] == enemyColor and endPiece[1] == "N":
-    #                 inCheck = True
-    #                 checks.append((endRow, endCol, m[0], m[1]))
-    #     return inCheck, pins, checks
+        elif pieceMove == "wR":
+            if startSq == 56:  # * a1
+                self.currentCasltingRight.wqs = False
+            elif startSq == 63:  # * h1
+                self.currentCasltingRight.wks = False
+        elif pieceMove == "bR":
+            if startSq == 0:  # * a8
+                self.currentCasltingRight.bqs = False
+            elif startSq == 7:  # * h8
+                self.currentCasltingRight.bks = False
+        # * a rook captured on its starting square takes that castling right with it
+        if pieceCaptured == "wR":
+            if endSq == 56:
+                self.currentCasltingRight.wqs = False
+            elif endSq == 63:
+                self.currentCasltingRight.wks = False
+        elif pieceCaptured == "bR":
+            if endSq == 0:
+                self.currentCasltingRight.bqs = False
+            elif endSq == 7:
+                self.currentCasltingRight.bks = False
+
+    # ? Get all possible Moves considering checks, as Move objects for the UI
+    def getValidMoves(self):
+        return [Move.fromPacked(move, self.board) for move in self.getLegalMoves()]
+
+    # ? Get all possible Moves considering checks, as packed moves
+    # * served from moveCache when the position was generated before, inCheck, checkMate and staleMate
+    # * are set either way (pins and checks only after a real generation)
+    def getLegalMoves(self):
+        cache = self.moveCache
+        if cache is None:
+            return self.generateLegalMoves()
+        entry = cache.probe(self.zobristKey)
+        if entry is not None:
+            moves, status = entry
+            self.inCheck = status & chessMoveCache.IN_CHECK != 0
+            self.checkMate = status & chessMoveCache.CHECKMATE != 0
+            self.staleMate = status & chessMoveCache.STALEMATE != 0
+            return array('H', moves)
+        moves = self.generateLegalMoves()
+        cache.store(self.zobristKey, moves, (chessMoveCache.IN_CHECK if self.inCheck else 0) |
+                    (chessMoveCache.CHECKMATE if self.checkMate else 0) |
+                    (chessMoveCache.STALEMATE if self.staleMate else 0))
+        return moves
 
-    # ? Get all possible Moves considering checks -> Naive
+    # ? generate the legal moves -> pins and checks
+    # * only king moves and en passant are tested with make/undo, every other move is
+    # * filtered with the pins and checks found by scanning outward from the king
+    def generateLegalMoves(self):
+        context = self.getLegalityContext()
+        isLegalMove = self.isLegalMove
+        moves = array('H')
+        for move in self.getPseudoMoves(context):
+            if isLegalMove(move, context):
+                moves.append(move)
 
-    def getValidMoves(self):
+        if len(moves) == 0:  # either checkmate or stalemate
+            if context[6]:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.staleMate = False
+            self.checkMate = False
 
-        tempEmpassantPossible = self.enpassantPossible
+        return moves
 
-        tempCastleRight = CastlingRights(
-            self.currentCasltingRight.wks, self.currentCasltingRight.bks, self.currentCasltingRight.wqs, self.currentCasltingRight.bqs)
+    # ? pins and checks of the side to move, worked out once so each move can then be tested on its own
+    # * sets inCheck, pins and checks and returns (king square, king row, king col, squares that answer a single
+    # * check or None, pinned square -> pin direction, double check, in check)
+    # * the context keeps the in check flag of this position, self.inCheck belongs to whichever position
+    # * generated moves last, a search may have been down other lines since
+    def getLegalityContext(self):
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        validSquares = None
+        if len(self.checks) == 1:  # * there is one check: block it, capture the checker or move the king
+            checkRow, checkCol, dr, dc = self.checks[0]
+            if self.board[checkRow][checkCol][1] in ('N', 'P'):
+                validSquares = {checkRow * 8 + checkCol}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquare = (kingRow + dr * i) * 8 + kingCol + dc * i
+                    validSquares.add(validSquare)
+                    if validSquare == checkRow * 8 + checkCol:
+                        break
+        pinDirections = {pin[0] * 8 + pin[1]: (pin[2], pin[3]) for pin in self.pins}
+        return kingRow * 8 + kingCol, kingRow, kingCol, validSquares, pinDirections, len(self.checks) > 1, \
+            self.inCheck
 
+    # ? pseudo legal moves of the side to move, castling included
+    def getPseudoMoves(self, context):
         moves = self.getAllPossibleMoves()
+        if not context[6]:
+            self.getCastleMoves(context[1], context[2], moves)
+        return moves
+
+    # ? is a move the side to move can make ignoring checks, for moves that did not come from the generator
+    def isPseudoMove(self, move, context):
+        startSq = move & 63
+        r, c = startSq >> 3, startSq & 7
+        piece = self.board[r][c]
+        if piece == "--" or (piece[0] == "w") != self.whiteToMove:
+            return False
+        moves = array('H')
+        self.moveFunctions[piece[1]](r, c, moves)
+        if piece[1] == "K" and not context[6]:
+            self.getCastleMoves(r, c, moves)
+        return move in moves
+
+    # ? does the pseudo legal move leave the own king safe, context from getLegalityContext
+    def isLegalMove(self, move, context):
+        kingSq, kingRow, kingCol, validSquares, pinDirections, doubleCheck, inCheck = context
+        startSq = move & 63
+        flag = move >> 12
+        if (startSq == kingSq and flag != MOVE_CASTLE) or flag == MOVE_ENPASSANT:
+            # * the king cant hide behind itself and en passant can expose a rank, so test these directly
+            self.makePackedMove(move)
+            self.whiteToMove = not self.whiteToMove
+            legal = not self.inCheckf()
+            self.whiteToMove = not self.whiteToMove
+            self.undoMove()
+            return legal
+        if doubleCheck:  # * double check, only the king can move
+            return False
+        endSq = (move >> 6) & 63
+        if validSquares is not None and endSq not in validSquares:
+            return False
+        pin = pinDirections.get(startSq)
+        # * a pinned piece can only move on the line through the king and the pinner
+        return pin is None or ((endSq >> 3) - kingRow) * pin[1] == ((endSq & 7) - kingCol) * pin[0]
+
+    # ? find the pieces pinned to the king of the side to move, and the pieces giving check
+    # * pins and checks are (row, col, dirRow, dirCol), direction is from the king outward
+    def checkForPinsAndChecks(self):
+        pins = []
+        checks = []
+        inCheck = False
+        if self.whiteToMove:
+            enemyColor = "b"
+            allyColor = "w"
+            startRow, startCol = self.whiteKingLocation
+        else:
+            enemyColor = "w"
+            allyColor = "b"
+            startRow, startCol = self.blackKingLocation
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
+                      (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = startRow + d[0] * i
+                endCol = startCol + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece[0] == allyColor:
+                        if possiblePin == ():
+                            possiblePin = (endRow, endCol, d[0], d[1])
+                        else:  # * second ally piece, no pin or check in this direction
+                            break
+                    elif endPiece[0] == enemyColor:
+                        type = endPiece[1]
+                        # * orthogonal rooks, diagonal bishops, queens, an adjacent king,
+                        # * and an adjacent pawn on the diagonals it attacks
+                        if (0 <= j <= 3 and type == "R") or (4 <= j <= 7 and type == "B") or \
+                                (i == 1 and type == "P" and ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
+                                (type == "Q") or (i == 1 and type == "K"):
+                            if possiblePin == ():
+                                inCheck = True
+                                checks.append((endRow, endCol, d[0], d[1]))
+                            else:
+                                pins.append(possiblePin)
+                        break
+                else:
+                    break
+        for m in KNIGHT_OFFSETS:
+            endRow = startRow + m[0]
+            endCol = startCol + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == enemyColor and endPiece[1] == "N":
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    # ? Get all possible Moves considering checks -> Naive
+    # * kept to cross check getValidMoves, every move is made and the king tested for check
+    def getValidMovesNaive(self):
+        return [Move.fromPacked(move, self.board) for move in self.getLegalMovesNaive()]
+
+    def getLegalMovesNaive(self):
+        pseudoMoves = self.getAllPossibleMoves()
 
         if self.whiteToMove:
             self.getCastleMoves(
-                self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+                self.whiteKingLocation[0], self.whiteKingLocation[1], pseudoMoves)
         else:
             self.getCastleMoves(
-                self.blackKingLocation[0], self.blackKingLocation[1], moves)
+                self.blackKingLocation[0], self.blackKingLocation[1], pseudoMoves)
 
-        for i in range(len(moves)-1, -1, -1):
-            self.makeMove(moves[i])
+        moves = array('H')
+        for move in pseudoMoves:
+            self.makePackedMove(move)
             self.whiteToMove = not self.whiteToMove
-            if self.inCheckf():
+            if not self.inCheckf():
                 # * if attacking move so its not a valid move
-                moves.remove(moves[i])
+                moves.append(move)
             self.whiteToMove = not self.whiteToMove
             self.undoMove()
         if len(moves) == 0:  # either checkmate or stalemate
@@ -259,9 +665,6 @@ class GameState():
             self.staleMate = False
             self.checkMate = False
 
-        self.enpassantPossible = tempEmpassantPossible
-        self.currentCasltingRight = tempCastleRight
-
         return moves
 
     # ? Determin if the current player is in check
@@ -273,18 +676,117 @@ class GameState():
 
     # ? determine if the enemy can attack the square (r,c)
     def squareUnderAttack(self, r, c):
-        # * switch to the oppoenent point of view
-        self.whiteToMove = not self.whiteToMove
-        oppoenentsMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove  # * switch turns back
-        for move in oppoenentsMoves:
-            if move.endRow == r and move.endCol == c:  # * king under attack
+        return self.isSquareAttacked(r, c, "b" if self.whiteToMove else "w")
+
+    # ? determine if any piece of color byColor attacks the square (r,c)
+    # * looks outward from the square instead of generating the attacker's moves, and stops at the first attacker
+    def isSquareAttacked(self, r, c, byColor):
+        board = self.board
+        for dr, dc in KNIGHT_OFFSETS:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == byColor + "N":
+                return True
+        # * white pawns attack up the board so they sit one row below the square, black pawns one row above
+        pawnRow = r + 1 if byColor == "w" else r - 1
+        if 0 <= pawnRow < 8:
+            if (c > 0 and board[pawnRow][c-1] == byColor + "P") or (c < 7 and board[pawnRow][c+1] == byColor + "P"):
                 return True
+        for dr, dc in KING_OFFSETS:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == byColor + "K":
+                return True
+        for directions, slider in ((ROOK_DIRECTIONS, "R"), (BISHOP_DIRECTIONS, "B")):
+            for dr, dc in directions:
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != "--":
+                        if endPiece[0] == byColor and (endPiece[1] == slider or endPiece[1] == "Q"):
+                            return True
+                        break
+                    endRow += dr
+                    endCol += dc
         return False
 
-    # ? Get all possible Moves
+    # ? the cheapest piece of color byColor attacking (r,c) as (row, col, piece), or None
+    # * squares in ignored count as empty, so static exchange evaluation can see x-ray attackers
+    def getLeastValuableAttacker(self, r, c, byColor, ignored=()):
+        board = self.board
+        pawnRow = r + 1 if byColor == "w" else r - 1
+        if 0 <= pawnRow < 8:
+            for pawnCol in (c - 1, c + 1):
+                if 0 <= pawnCol < 8 and board[pawnRow][pawnCol] == byColor + "P" and (pawnRow, pawnCol) not in ignored:
+                    return (pawnRow, pawnCol, byColor + "P")
+        for dr, dc in KNIGHT_OFFSETS:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == byColor + "N" and \
+                    (endRow, endCol) not in ignored:
+                return (endRow, endCol, byColor + "N")
+        sliders = []  # * first piece on every ray, then pick the cheapest
+        for directions, slider in ((BISHOP_DIRECTIONS, "B"), (ROOK_DIRECTIONS, "R")):
+            for dr, dc in directions:
+                endRow = r + dr
+                endCol = c + dc
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != "--" and (endRow, endCol) not in ignored:
+                        if endPiece[0] == byColor and (endPiece[1] == slider or endPiece[1] == "Q"):
+                            sliders.append((endRow, endCol, endPiece))
+                        break
+                    endRow += dr
+                    endCol += dc
+        for type in "BRQ":
+            for attacker in sliders:
+                if attacker[2][1] == type:
+                    return attacker
+        for dr, dc in KING_OFFSETS:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == byColor + "K" and \
+                    (endRow, endCol) not in ignored:
+                return (endRow, endCol, byColor + "K")
+        return None
+
+    # ? map of every square attacked by color byColor, attacked[r][c] is True when (r,c) is attacked
+    def getAttackedSquares(self, byColor):
+        board = self.board
+        attacked = [[False] * 8 for _ in range(8)]
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != byColor:
+                    continue
+                type = piece[1]
+                if type == "P":
+                    endRow = r - 1 if byColor == "w" else r + 1
+                    for endCol in (c - 1, c + 1):
+                        if 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked[endRow][endCol] = True
+                elif type == "N" or type == "K":
+                    for dr, dc in (KNIGHT_OFFSETS if type == "N" else KING_OFFSETS):
+                        if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                            attacked[r + dr][c + dc] = True
+                else:
+                    directions = ROOK_DIRECTIONS if type == "R" else BISHOP_DIRECTIONS if type == "B" else \
+                        ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+                    for dr, dc in directions:
+                        endRow = r + dr
+                        endCol = c + dc
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked[endRow][endCol] = True
+                            if board[endRow][endCol] != "--":
+                                break
+                            endRow += dr
+                            endCol += dc
+        return attacked
+
+    # ? Get all possible Moves, packed into an array('H')
     def getAllPossibleMoves(self):
-        moves = []
+        moves = array('H')
         for r in range(len(self.board)):
             for c in range(len(self.board[r])):
                 turn = self.board[r][c][0]
@@ -295,46 +797,44 @@ class GameState():
 
     def getPawnMoves(self, r, c, moves):
         if self.whiteToMove:
-            if self.board[r-1][c] == "--":
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--":
-                    moves.append(Move((r, c), (r-2, c), self.board))
-            if c-1 >= 0:  # * capture to the left
-                if self.board[r-1][c-1][0] == "b":
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-
-            if c+1 <= 7:  # * capture to the right
-                if self.board[r-1][c+1][0] == "b":
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
-
+            step, startRow, lastRow, enemyColor = -1, 6, 0, "b"
+        else:
+            step, startRow, lastRow, enemyColor = 1, 1, 7, "w"
+        start = r * 8 + c
+        endRow = r + step
+        if self.board[endRow][c] == "--":
+            self.addPawnMove(start, endRow, c, lastRow, moves)
+            if r == startRow and self.board[endRow + step][c] == "--":
+                moves.append(start | ((endRow + step) * 8 + c) << 6 | MOVE_DOUBLE_PUSH << 12)
+        for endCol in (c - 1, c + 1):  # * capture to the left and right
+            if 0 <= endCol <= 7:
+                if self.board[endRow][endCol][0] == enemyColor:
+                    self.addPawnMove(start, endRow, endCol, lastRow, moves)
+                elif (endRow, endCol) == self.enpassantPossible:
+                    moves.append(start | (endRow * 8 + endCol) << 6 | MOVE_ENPASSANT << 12)
+
+    # * a pawn reaching the last row adds one move per promotion piece, queen last
+    def addPawnMove(self, start, endRow, endCol, lastRow, moves):
+        end = start | (endRow * 8 + endCol) << 6
+        if endRow == lastRow:
+            for flag in range(MOVE_PROMOTION, MOVE_PROMOTION + 4):
+                moves.append(end | flag << 12)
         else:
-            if self.board[r+1][c] == "--":
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--":
-                    moves.append(Move((r, c), (r+2, c), self.board))
-            if c-1 >= 0:  # * capture to the left
-                if self.board[r+1][c-1][0] == "w":
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
-
-            if c+1 <= 7:  # * capture to the right
-                if self.board[r+1][c+1][0] == "w":
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enpassantPossible:
-                    moves.append(
-                        Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
+            moves.append(end)
 
     def getRookMoves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+        self.getSlidingMoves(r, c, ROOK_DIRECTIONS, moves)
+
+    def getBishopMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, BISHOP_DIRECTIONS, moves)
+
+    def getQueenMoves(self, r, c, moves):
+        self.getBishopMoves(r, c, moves)
+        self.getRookMoves(r, c, moves)
+
+    def getSlidingMoves(self, r, c, directions, moves):
         enemyColor = "b" if self.whiteToMove else 'w'
+        start = r * 8 + c
         for d in directions:
             for i in range(1, 8):
                 endRow = r + d[0]*i
@@ -342,11 +842,9 @@ class GameState():
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "--":
-                        moves.append(
-                            Move((r, c), (endRow, endCol), self.board))
+                        moves.append(start | (endRow * 8 + endCol) << 6)
                     elif endPiece[0] == enemyColor:
-                        moves.append(
-                            Move((r, c), (endRow, endCol), self.board))
+                        moves.append(start | (endRow * 8 + endCol) << 6)
                         break
                     else:
                         break
@@ -354,16 +852,15 @@ class GameState():
                     break
 
     def getKingMoves(self, r, c, moves):
-        kingMoves = ((0, -1), (0, 1), (0, 0), (1, 0), (1, -1),
-                     (1, 1), (-1, 0), (-1, 1), (-1, -1))
         allColor = "w" if self.whiteToMove else "b"
-        for m in kingMoves:
+        start = r * 8 + c
+        for m in KING_OFFSETS:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allColor:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                    moves.append(start | (endRow * 8 + endCol) << 6)
 
     # ? generate all valid castle moves for a king, and add them to the list of moves
 
@@ -378,54 +875,28 @@ class GameState():
     def getKingSideCaslteMoves(self, r, c, moves):
         if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
             if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
-                moves.append(
-                    Move((r, c), (r, c+2), self.board, isCastleMove=True))
+                moves.append(packMove(r * 8 + c, r * 8 + c + 2, MOVE_CASTLE))
 
     def getQueenSideCastleMoves(self, r, c, moves):
         if self.board[r][c-1] == "--" and self.board[r][c-2] == "--" and self.board[r][c-3] == "--":
             if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
-                moves.append(
-                    Move((r, c), (r, c-2), self.board, isCastleMove=True))
+                moves.append(packMove(r * 8 + c, r * 8 + c - 2, MOVE_CASTLE))
 
     def getKnightMoves(self, r, c, moves):
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, -2),
-                       (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
         allColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
+        start = r * 8 + c
+        for m in KNIGHT_OFFSETS:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allColor:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
-
-    def getQueenMoves(self, r, c, moves):
-        self.getBishopMoves(r, c, moves)
-        self.getRookMoves(r, c, moves)
-
-    def getBishopMoves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemyColor = "b" if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0]*i
-                endCol = c + d[1]*i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":
-                        moves.append(
-                            Move((r, c), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor:
-                        moves.append(
-                            Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
+                    moves.append(start | (endRow * 8 + endCol) << 6)
 
 
 class CastlingRights():
+    __slots__ = ("wks", "bks", "wqs", "bqs")
+
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
         self.bks = bks
@@ -436,6 +907,19 @@ class CastlingRights():
         return str(self.wks)+" "+str(self.wqs)+" "+str(self.bks)+" "+str(self.bqs)
 
 
+# ? uci style notation of a packed move, e.g. e2e4 or e7e8q
+def getPackedNotation(move):
+    startSq = move & 63
+    endSq = (move >> 6) & 63
+    flag = move >> 12
+    notation = Move.colsToFiles[startSq & 7] + Move.rowsToRanks[startSq >> 3] + \
+        Move.colsToFiles[endSq & 7] + Move.rowsToRanks[endSq >> 3]
+    if flag >= MOVE_PROMOTION:
+        notation += PROMOTION_PIECES[flag - MOVE_PROMOTION].lower()
+    return notation
+
+
+# ? full move object, only built for the UI and notation; the engine uses packed moves
 class Move():
 
     ranksToRows = {'1': 7, '2': 6, '3': 5,
@@ -448,7 +932,7 @@ class Move():
     def __repr__(self):
         return str(self.moveID)
 
-    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionPiece="Q"):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
@@ -460,6 +944,7 @@ class Move():
 
         self.isPawnPromotion = ((self.pieceMove == "wP" and self.endRow == 0) or (
             self.pieceMove == "bP" and self.endRow == 7))
+        self.promotionPiece = promotionPiece if self.isPawnPromotion else None
 
         self.isEnpassantMove = isEnpassantMove
 
@@ -468,15 +953,39 @@ class Move():
         # * Castle Move
         self.isCastleMove = isCastleMove
 
+        if self.isCastleMove:
+            flag = MOVE_CASTLE
+        elif self.isEnpassantMove:
+            flag = MOVE_ENPASSANT
+        elif self.isPawnPromotion:
+            flag = MOVE_PROMOTION + PROMOTION_PIECES.index(self.promotionPiece)
+        elif self.pieceMove[1] == "P" and abs(self.startRow - self.endRow) == 2:
+            flag = MOVE_DOUBLE_PUSH
+        else:
+            flag = MOVE_NORMAL
+        self.packed = packMove(self.startRow * 8 + self.startCol, self.endRow * 8 + self.endCol, flag)
+
+    @staticmethod
+    def fromPacked(move, board):
+        startSq = move & 63
+        endSq = (move >> 6) & 63
+        flag = move >> 12
+        return Move((startSq >> 3, startSq & 7), (endSq >> 3, endSq & 7), board,
+                    isEnpassantMove=flag == MOVE_ENPASSANT, isCastleMove=flag == MOVE_CASTLE,
+                    promotionPiece=PROMOTION_PIECES[flag - MOVE_PROMOTION] if flag >= MOVE_PROMOTION else "Q")
+
     # * Overriding the equals method
 
     def __eq__(self, other):
         if isinstance(other, Move):
-            return self.moveID == other.moveID
+            return self.moveID == other.moveID and self.promotionPiece == other.promotionPiece
         return False
 
     def getChessNotation(self):
-        return self.getRankedFile(self.startRow, self.startCol) + self.getRankedFile(self.endRow, self.endCol)
+        notation = self.getRankedFile(self.startRow, self.startCol) + self.getRankedFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promotionPiece.lower()
+        return notation
 
     def getRankedFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
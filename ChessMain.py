@@ -6,12 +6,18 @@ import pygame as p
 import ChessEngine
 import os
 import chessAI
+import chessAIWorker
+import chessBitboard
 
 WIDTH = HEIGHT = 512  # 400 is another good option
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15  # for animations latter on
 IMAGES = {}
+# * position class used for the game, ChessEngine.GameState is the plain 8x8 board version
+GAME_STATE = chessBitboard.BitboardGameState
+AI_TIME_LIMIT = chessAI.TIME_LIMIT  # * seconds per AI move
+PONDER = True  # * let the AI think on the human's time
 
 # * initialize a golbale Dic of images
 
@@ -29,7 +35,9 @@ def main():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    gs = GAME_STATE()
+    # * the AI searches in a background process so this loop keeps running at MAX_FPS
+    aiWorker = chessAIWorker.AIWorker(GAME_STATE)
 
     validMoves = gs.getValidMoves()
     moveMade = False
@@ -40,6 +48,7 @@ def main():
     playerClicks = []  # * keep track of player clicks, 2 tuples
 
     gameOver = False
+    drawReason = None  # * set when the game is drawn by repetition, the fifty move rule or material
     playerOne = True  # TODO: for diffculties playerOne and playerTwo wil be ints
     playerTwo = False
     while running:
@@ -48,6 +57,7 @@ def main():
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+                aiWorker.close()
             # ? mouse Handler
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and isHumanTrun:
@@ -69,35 +79,60 @@ def main():
                                 moveMade = True
                                 sqSelected = ()  # * reset user clicks
                                 playerClicks = []
+                                break
                         if not moveMade:
                             playerClicks = [sqSelected]
             # ? Key Handler
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:  # undo if z is pressed
+                    aiWorker.cancel()  # * the position it was searching is gone
                     gs.undoMove()
                     moveMade = True
+                    gameOver = False
                 if e.key == p.K_r:  # ? rest the board when r is pressed
-                    gs = ChessEngine.GameState()
+                    aiWorker.cancel()
+                    gs = GAME_STATE()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     gameOver = False
+                    drawReason = None
 
         # ? AI move finder Logic
-        if not gameOver and not isHumanTrun:
+        if not running:
+            break
+        if not gameOver and not isHumanTrun and not moveMade:
             # AIMove = chessAI.findRandomMove(validMoves)
             # AIMove = chessAI.findBestMove(gs, validMoves)
-            AIMove = chessAI.findBestMoveMinMax(gs, validMoves)
-            if AIMove is None:
-                AIMove = chessAI.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
+            if not aiWorker.isThinking():
+                aiWorker.startSearch(gs, AI_TIME_LIMIT)
+            AIMove = aiWorker.poll()
+            if AIMove is not None:
+                for move in validMoves:
+                    if move.packed == AIMove:
+                        gs.makeMove(move)
+                        moveMade = True
+                        break
+                if not moveMade:
+                    gs.makeMove(chessAI.findRandomMove(validMoves))
+                    moveMade = True
+        elif not gameOver and isHumanTrun and PONDER and not (playerOne and playerTwo):
+            if not aiWorker.isPondering():
+                aiWorker.ponder(gs, aiWorker.ponderMove if len(gs.movelog) > 0 else None)
+            aiWorker.poll()
 
         if moveMade:
+            if aiWorker.isPondering():
+                aiWorker.cancel()
             validMoves = gs.getValidMoves()
+            drawReason = gs.getDrawReason()
             moveMade = False
         drawGameState(screen, gs, validMoves, sqSelected)
+        if aiWorker.progress is not None and (aiWorker.isThinking() or aiWorker.isPondering()):
+            depth, score, move, nps = aiWorker.progress
+            drawInfo(screen, ("pondering " if aiWorker.isPondering() else "thinking ") + "depth " + str(depth) +
+                     "  " + move + "  " + str(score) + "  " + str(nps) + " nps")
 
         if gs.checkMate:
             gameOver = True
@@ -108,6 +143,9 @@ def main():
         if gs.staleMate:
             gameOver = True
             drawText(screen, "StaleMate")
+        elif drawReason is not None and not gs.checkMate:
+            gameOver = True
+            drawText(screen, "Draw by " + drawReason)
 
         clock.tick(MAX_FPS)
         p.display.flip()
@@ -163,6 +201,17 @@ def drawPieces(screen, board):
                     c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 
+# * small status line at the bottom of the board, for the AI progress
+def drawInfo(screen, text):
+    font = p.font.SysFont("Helvitce", 20, False, False)
+    textObject = font.render(text, 0, p.Color("Black"))
+    s = p.Surface((WIDTH, textObject.get_height() + 4))
+    s.set_alpha(160)
+    s.fill(p.Color("white"))
+    screen.blit(s, (0, HEIGHT - s.get_height()))
+    screen.blit(textObject, (4, HEIGHT - textObject.get_height() - 2))
+
+
 def drawText(screen, text):
     font = p.font.SysFont("Helvitce", 32, True, False)
     textObject = font.render(text, 0, p.Color("Grey"))
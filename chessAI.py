@@ -1,52 +1,553 @@
+import os
 import random
+import time
+import chessBook
+import chessTablebase
+import chessTT
+import chessEval
+import chessNumpyEval
+from ChessEngine import MOVE_ENPASSANT, MOVE_PROMOTION, NULL_MOVE, getPackedNotation
 
-piceScore = {"K": 0, "Q": 10, "N": 3, "R": 5, "P": 1, "B": 3}
-CHECKMATE = 1000
+piceScore = chessEval.PIECE_VALUE_MG  # * centipawns
+CHECKMATE = 100000
 STALEMATE = 0
-DEPTH = 2
+DEPTH = 3
+MAX_PLY = 64
+TIME_LIMIT = 2.0  # * seconds the AI gets per move
+CHECK_EVERY = 1023  # * nodes between clock checks, must be 2^n - 1
+TT_SIZE_MB = 16
+# * piece values for ordering captures, most valuable victim first then least valuable attacker
+MVV_LVA_VALUE = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+# * piece values for static exchange evaluation, the king can be the last attacker but never be won
+SEE_VALUE = dict(piceScore, K=20000)
+# * quiescence skips a capture that cannot bring the score back up to alpha even with this much to spare
+DELTA_MARGIN = 200
+MOVE_QUEEN_PROMOTION = MOVE_PROMOTION + 3  # * searched with the good captures
+# * tablebase wins score below the mate scores and above any evaluation, a shorter mate scores higher
+TB_WIN = CHECKMATE - MAX_PLY - 1
+DRAW_MAX_PHASE = 2  # * two bishops at most, more material is never an insufficient material draw
+TB_MAX_PHASE = 8  # * no table has more than two pieces besides the kings, two queens are phase 8
+# * scores at least this far from 0 are proven mates or tablebase results, pruning never returns or risks them
+WIN_BOUND = TB_WIN - MAX_PLY - chessTablebase.MAX_PLIES
+
+# ? selective search, every part can be switched off (per Searcher too) to measure what it is worth
+NULL_MOVE_PRUNING = True
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2  # * one more from depth 7 on
+LATE_MOVE_REDUCTIONS = True
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3  # * moves searched at full depth before the quiet ones get reduced
+FUTILITY_PRUNING = True
+FUTILITY_MARGIN = (0, 200, 350)  # * by remaining depth, a quiet move this far below alpha is not searched
+REVERSE_FUTILITY_PRUNING = True
+REVERSE_FUTILITY_MARGIN = 120  # * per ply of remaining depth, up to depth 3
+CHECK_EXTENSIONS = True
+# * with numpy installed the root moves start out sorted by the batch evaluator's score after each move
+NUMPY_ROOT_ORDERING = True
+
+# * shared between searches so later moves reuse what earlier searches found
+transpositionTable = chessTT.TranspositionTable(TT_SIZE_MB)
+# * built with chessBook.py, opened on first use; without the file every move is searched
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+USE_BOOK = True
+openingBook = None
+# * generated with chessTablebase.py, positions with a table are not searched any further
+TABLEBASE_DIR = chessTablebase.TABLEBASE_DIR
+USE_TABLEBASES = True
+tablebases = None
 
 
 def findRandomMove(validMoves):
     return validMoves[random.randint(0, len(validMoves)-1)]
 
 
-def findBestMoveMinMax(gs, validMoves):
-    global nextMove
-    nextMove = None
-    findMoveMinMax(gs, validMoves, DEPTH, gs.whiteToMove)
-    return nextMove
-
-
-def findMoveMinMax(gs, validMoves, depth, whiteToMove):
-    global nextMove
-    if depth == 0:
-        return scoreMaterial(gs.board)
-    if whiteToMove:
-        maxScore = -CHECKMATE
-        for move in validMoves:
-            gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth-1, False)
-
-            if score > maxScore:
-                maxScore = score
-                if depth == DEPTH:
-                    nextMove = move
+# ? search the position with iterative deepening negamax alpha-beta and return the best move
+# * searches deeper until timeLimit (seconds) or nodeLimit runs out, or until depth is reached
+# * the search works on packed moves, the result is handed back as the matching Move from validMoves
+def findBestMoveNegaMax(gs, validMoves, depth=MAX_PLY - 1, timeLimit=TIME_LIMIT, nodeLimit=None):
+    bestMove = findBookMove(gs)
+    if bestMove is None:
+        bestMove = Searcher(transpositionTable).think(gs, depth, timeLimit, nodeLimit, validMoves).move
+    for move in validMoves:
+        if move.packed == bestMove:
+            return move
+    return None
+
+
+# ? packed move from the opening book for gs, None when out of book or there is no book
+def findBookMove(gs):
+    global openingBook
+    if not USE_BOOK:
+        return None
+    if openingBook is None:
+        if not os.path.exists(BOOK_PATH):
+            return None
+        openingBook = chessBook.OpeningBook(BOOK_PATH)
+    return openingBook.chooseMove(gs)
+
+
+# ? tablebase byte for gs, None without tables or when the position is not in them
+def probeTablebases(gs):
+    global tablebases
+    if not USE_TABLEBASES or gs.phase > TB_MAX_PHASE:
+        return None
+    if tablebases is None:
+        tablebases = chessTablebase.Tablebases(TABLEBASE_DIR)
+    return tablebases.probe(gs)
+
+
+def tablebaseScore(value, ply):
+    if value == chessTablebase.DRAW:
+        return STALEMATE
+    plies = value - 1
+    if plies % 2:
+        return TB_WIN - ply - plies
+    return -TB_WIN + ply + plies
+
+
+# ? SearchResult straight from the tablebases when the root position is in them, None otherwise
+def tablebaseResult(gs, rootMoves):
+    value = probeTablebases(gs)
+    if value is None or not rootMoves:
+        return None
+    move = tablebases.bestMove(gs)
+    if move is None or move not in rootMoves:
+        return None
+    return SearchResult(move, tablebaseScore(value, 0), 1, [move], 0)
+
+
+class SearchResult():
+    def __init__(self, move, score, depth, pv, nodes, elapsed=0.0):
+        self.move = move
+        self.score = score  # * from the point of view of the side to move
+        self.depth = depth
+        self.pv = pv  # * principal variation, list of packed moves starting with move
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return "depth " + str(self.depth) + " score " + str(self.score) + " nodes " + str(self.nodes) + \
+            " time " + str(round(self.elapsed, 3)) + " pv " + " ".join(getPackedNotation(move) for move in self.pv)
+
+
+class SearchStopped(Exception):
+    pass
+
+
+# ? negamax alpha-beta search, all the search state lives on the object instead of in globals
+class Searcher():
+    def __init__(self, tt=None, stats=None):
+        self.tt = tt if tt is not None else chessTT.TranspositionTable(TT_SIZE_MB)
+        self.stats = stats  # * optional chessStats.SearchStats, filled in by every think
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [0] * 4096  # * indexed by the start and end square bits of a packed move
+        self.pvTable = [[] for _ in range(MAX_PLY + 1)]
+        self.deadline = None
+        self.nodeLimit = None
+        self.shouldStop = None  # * optional function, the search stops when it returns True
+        self.onIteration = None  # * optional function, called with the SearchResult of every finished depth
+        self.useNullMove = NULL_MOVE_PRUNING
+        self.useLMR = LATE_MOVE_REDUCTIONS
+        self.useFutility = FUTILITY_PRUNING
+        self.useReverseFutility = REVERSE_FUTILITY_PRUNING
+        self.useCheckExtensions = CHECK_EXTENSIONS
+
+    # ? fixed depth search
+    def search(self, gs, depth, validMoves=None):
+        return self.think(gs, depth, validMoves=validMoves)
+
+    # ? iterative deepening: search depth 1, 2, 3 ... and keep the result of the last iteration that finished
+    # * timeLimit is a hard deadline in seconds, a new iteration is only started while less than half of it is used
+    def think(self, gs, maxDepth=MAX_PLY - 1, timeLimit=None, nodeLimit=None, validMoves=None):
+        if self.stats is None:
+            return self.iterate(gs, maxDepth, timeLimit, nodeLimit, validMoves)
+        self.stats.begin(self, gs)
+        result = None
+        try:
+            result = self.iterate(gs, maxDepth, timeLimit, nodeLimit, validMoves)
+        finally:
+            self.stats.end(self, result)
+        return result
+
+    def iterate(self, gs, maxDepth, timeLimit, nodeLimit, validMoves):
+        startTime = time.perf_counter()
+        self.deadline = startTime + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [0] * 4096
+        self.tt.newSearch()
+        if validMoves is None:
+            rootMoves = list(gs.getLegalMoves())
+        else:
+            rootMoves = [move.packed for move in validMoves]
+        if NUMPY_ROOT_ORDERING and chessNumpyEval.AVAILABLE:
+            rootMoves = chessNumpyEval.orderRootMoves(gs, rootMoves)
+        rootLength = len(gs.movelog)
+
+        result = tablebaseResult(gs, rootMoves)
+        if result is not None:
+            result.elapsed = time.perf_counter() - startTime
+            if self.onIteration is not None:
+                self.onIteration(result)
+            return result
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, 0, rootMoves[:1], 0)
+        for depth in range(1, min(maxDepth, MAX_PLY - 1) + 1):
+            try:
+                score = self.negaMax(gs, depth, -CHECKMATE - 1, CHECKMATE + 1, 0, rootMoves)
+            except SearchStopped:
+                # * unwind the moves the aborted iteration left on the board
+                while len(gs.movelog) > rootLength:
+                    gs.undoMove()
+                break
+            if self.stats is not None:
+                self.stats.iteration(self.nodes)
+            pv = self.extendPV(gs, self.pvTable[0], depth)
+            result = SearchResult(pv[0] if pv else result.move, score, depth, pv, self.nodes,
+                                  time.perf_counter() - startTime)
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if len(rootMoves) <= 1 or abs(score) > CHECKMATE - MAX_PLY:
+                break  # * forced move or a forced mate, deeper search changes nothing
+            if self.deadline is not None and time.perf_counter() - startTime > timeLimit / 2:
+                break
+            if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - startTime
+        return result
+
+    # ? transposition table cutoffs cut the collected PV short, follow the stored best moves to fill it up
+    def extendPV(self, gs, pv, depth):
+        pv = list(pv)
+        for move in pv:
+            gs.makePackedMove(move)
+        while len(pv) < depth:
+            entry = self.tt.probe(gs.zobristKey)
+            if entry is None or entry[3] == 0 or entry[3] not in gs.getLegalMoves():
+                break
+            pv.append(entry[3])
+            gs.makePackedMove(entry[3])
+        for _ in pv:
             gs.undoMove()
-        return maxScore
-    else:
-        minScore = CHECKMATE
-        for move in validMoves:
-            gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth-1, True)
-
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH:
-                    nextMove = move
+        return pv
+
+    # * called every CHECK_EVERY + 1 nodes so the clock is cheap to watch
+    def checkLimits(self):
+        if (self.deadline is not None and time.perf_counter() >= self.deadline) or \
+                (self.nodeLimit is not None and self.nodes >= self.nodeLimit) or \
+                (self.shouldStop is not None and self.shouldStop()):
+            raise SearchStopped()
+
+    def negaMax(self, gs, depth, alpha, beta, ply, moves=None):
+        self.nodes += 1
+        if self.nodes & CHECK_EVERY == 0:
+            self.checkLimits()
+        self.pvTable[ply] = []
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(gs, alpha, beta, ply)
+        if ply > 0:
+            # * a repeated position, fifty moves without progress or too little material to mate all end the line
+            if gs.halfmoveClock >= 100 or gs.isRepetition() or \
+                    (gs.phase <= DRAW_MAX_PHASE and gs.isInsufficientMaterial()):
+                return STALEMATE
+            value = probeTablebases(gs)
+            if value is not None:
+                return tablebaseScore(value, ply)
+
+        hashMove = 0
+        entry = self.tt.probe(gs.zobristKey)
+        if entry is not None:
+            entryDepth, entryScore, bound, hashMove = entry
+            if entryDepth >= depth and ply > 0:  # * the root always searches, it has to produce a move
+                entryScore = scoreFromTT(entryScore, ply)
+                if bound == chessTT.EXACT or (bound == chessTT.LOWER and entryScore >= beta) or \
+                        (bound == chessTT.UPPER and entryScore <= alpha):
+                    return entryScore
+
+        if moves is None:
+            # * interior nodes pick their moves lazily, a cutoff by an early move skips generating the rest
+            context = gs.getLegalityContext()
+            inCheck = context[6]
+            orderedMoves = self.pickMoves(gs, context, hashMove, ply)
+        else:
+            if len(moves) == 0:
+                return -CHECKMATE + ply if gs.inCheckf() else STALEMATE
+            inCheck = gs.inCheckf()
+            orderedMoves = self.orderMoves(gs, moves, hashMove, ply)
+        if inCheck and self.useCheckExtensions and ply < MAX_PLY // 2:
+            depth += 1  # * look one ply further at every check, so forcing lines are not cut at the horizon
+
+        futilityScore = None
+        if ply > 0 and not inCheck and abs(beta) < WIN_BOUND:
+            staticEval = gs.getEvaluation() * (1 if gs.whiteToMove else -1)
+            # * reverse futility: so far above beta that a quiet move from the opponent will not bring it back
+            if self.useReverseFutility and depth <= 3 and staticEval - REVERSE_FUTILITY_MARGIN * depth >= beta:
+                self.count("reverseFutility")
+                return staticEval - REVERSE_FUTILITY_MARGIN * depth
+            # * null move: if passing still keeps the score above beta, a real move surely will
+            # * not in pawn endings (zugzwang) and never twice in a row
+            if self.useNullMove and depth >= NULL_MOVE_MIN_DEPTH and staticEval >= beta and \
+                    gs.movelog and gs.movelog[-1] != NULL_MOVE and hasPieces(gs):
+                gs.makeNullMove()
+                score = -self.negaMax(gs, depth - 1 - NULL_MOVE_REDUCTION - (depth > 6), -beta, -beta + 1, ply + 1)
+                gs.undoMove()
+                if score >= beta:
+                    self.count("nullMoveCutoffs")
+                    return beta
+            if self.useFutility and depth < len(FUTILITY_MARGIN) and \
+                    staticEval + FUTILITY_MARGIN[depth] <= alpha and abs(alpha) < WIN_BOUND:
+                futilityScore = staticEval + FUTILITY_MARGIN[depth]
+
+        board = gs.board
+        alphaOrig = alpha
+        bestScore = -CHECKMATE - 1
+        bestMove = 0
+        index = -1
+        for index, move in enumerate(orderedMoves):
+            endSq = (move >> 6) & 63
+            isQuiet = board[endSq >> 3][endSq & 7] == "--" and move >> 12 < MOVE_ENPASSANT
+            gs.makePackedMove(move)
+            reduction = 0
+            if isQuiet and index > 0 and not inCheck and (futilityScore is not None or (
+                    self.useLMR and depth >= LMR_MIN_DEPTH and index >= LMR_FULL_MOVES)):
+                givesCheck = gs.inCheckf()
+                if futilityScore is not None and not givesCheck:
+                    gs.undoMove()  # * futility: even a good quiet move will not lift this node to alpha
+                    self.count("futilityPrunes")
+                    if futilityScore > bestScore:
+                        bestScore = futilityScore
+                    continue
+                if self.useLMR and depth >= LMR_MIN_DEPTH and index >= LMR_FULL_MOVES and not givesCheck:
+                    reduction = 2 if depth >= 6 and index >= 2 * LMR_FULL_MOVES else 1
+            if reduction:
+                # * late move reduction: a shallower null window search, searched again in full if it beats alpha
+                score = -self.negaMax(gs, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if score > alpha:
+                    self.count("lmrResearches")
+                    score = -self.negaMax(gs, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negaMax(gs, depth - 1, -beta, -alpha, ply + 1)
             gs.undoMove()
-        return minScore
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if alpha >= beta:
+                        if self.stats is not None:
+                            self.stats.cutoffAt(index)
+                        if isQuiet:  # * quiet move that refuted the line
+                            self.storeKiller(move, ply)
+                            self.history[move & 0xFFF] += depth * depth
+                        break
+        if index == -1:  # * the picker found no legal move
+            return -CHECKMATE + ply if inCheck else STALEMATE
+
+        if bestScore <= alphaOrig:
+            bound = chessTT.UPPER
+        elif bestScore >= beta:
+            bound = chessTT.LOWER
+        else:
+            bound = chessTT.EXACT
+        self.tt.store(gs.zobristKey, depth, scoreToTT(bestScore, ply), bound, bestMove)
+        return bestScore
+
+    # ? capture only search at the leaves, so the evaluation is never taken in the middle of an exchange
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & CHECK_EVERY == 0:
+            self.checkLimits()
+        self.pvTable[ply] = []
+        moves = gs.getLegalMoves()
+        if len(moves) == 0:
+            return -CHECKMATE + ply if gs.checkMate else STALEMATE
+        standPat = gs.getEvaluation() * (1 if gs.whiteToMove else -1)
+        if ply >= MAX_PLY - 1:
+            return standPat
+
+        board = gs.board
+        inCheck = gs.inCheck
+        if inCheck:  # * no standing pat in check, every evasion is searched
+            bestScore = -CHECKMATE - 1
+        else:
+            if standPat >= beta:
+                return standPat
+            # * delta pruning: even winning a queen would not reach alpha
+            if standPat + SEE_VALUE["Q"] + DELTA_MARGIN < alpha:
+                return standPat
+            bestScore = standPat
+            alpha = max(alpha, standPat)
+            moves = [move for move in moves if move >> 12 >= MOVE_ENPASSANT or
+                     board[(move >> 9) & 7][(move >> 6) & 7] != "--"]
+
+        for move in self.orderMoves(gs, moves, 0, ply):
+            if not inCheck and move >> 12 < MOVE_PROMOTION:
+                captured = board[(move >> 9) & 7][(move >> 6) & 7]
+                if standPat + SEE_VALUE[captured[1] if captured != "--" else "P"] + DELTA_MARGIN < alpha:
+                    continue  # * delta pruning for this capture
+                if staticExchange(gs, move) < 0:
+                    continue  # * losing capture
+            gs.makePackedMove(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+    def count(self, event):
+        if self.stats is not None:
+            self.stats.count(event)
+
+    def storeKiller(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    # ? staged move picker: yields the legal moves one at a time and builds each stage only when it is reached
+    # * hash move, captures that do not lose material (and queen promotions) by MVV-LVA, killer moves,
+    # * quiet moves by history, losing captures last; legality is only checked for the move about to be tried
+    def pickMoves(self, gs, context, hashMove, ply):
+        isLegalMove = gs.isLegalMove
+        if hashMove and gs.isPseudoMove(hashMove, context) and isLegalMove(hashMove, context):
+            yield hashMove
+
+        board = gs.board
+        captures = []
+        quiets = []
+        for move in gs.getPseudoMoves(context):
+            if move == hashMove:
+                continue
+            flag = move >> 12
+            if board[(move >> 9) & 7][(move >> 6) & 7] != "--" or flag == MOVE_ENPASSANT or flag == MOVE_QUEEN_PROMOTION:
+                captures.append(move)
+            else:
+                quiets.append(move)
+
+        def captureOrder(move):
+            captured = board[(move >> 9) & 7][(move >> 6) & 7]
+            if captured != "--":
+                victim = MVV_LVA_VALUE[captured[1]]
+            else:
+                victim = MVV_LVA_VALUE["P" if move >> 12 == MOVE_ENPASSANT else "Q"]
+            return 10 * victim - MVV_LVA_VALUE[board[(move >> 3) & 7][move & 7][1]]
+        badCaptures = []
+        for move in sorted(captures, key=captureOrder, reverse=True):
+            if move >> 12 < MOVE_PROMOTION:
+                captured = board[(move >> 9) & 7][(move >> 6) & 7]
+                # * only a capture of something cheaper than the capturer can lose material
+                if MVV_LVA_VALUE[captured[1] if captured != "--" else "P"] < \
+                        MVV_LVA_VALUE[board[(move >> 3) & 7][move & 7][1]] and staticExchange(gs, move) < 0:
+                    badCaptures.append(move)
+                    continue
+            if isLegalMove(move, context):
+                yield move
+
+        killers = [killer for killer in self.killers[ply] if killer and killer in quiets]
+        for move in killers:
+            if isLegalMove(move, context):
+                yield move
+
+        history = self.history
+        quiets.sort(key=lambda move: history[move & 0xFFF], reverse=True)
+        for move in quiets:
+            if move not in killers and isLegalMove(move, context):
+                yield move
+
+        for move in badCaptures:
+            if isLegalMove(move, context):
+                yield move
+
+    # ? hash move first, then captures by MVV-LVA, then killer moves, then quiet moves by history
+    # * for a list of moves known to be legal (the root), returns a new sorted list, the pieces are read off the board since a packed move only has squares
+    def orderMoves(self, gs, moves, hashMove, ply):
+        board = gs.board
+        killers = self.killers[ply]
+        history = self.history
+
+        def moveOrder(move):
+            if move == hashMove:
+                return 1000000
+            captured = board[(move >> 9) & 7][(move >> 6) & 7]
+            if captured != "--":
+                return 100000 + 10 * MVV_LVA_VALUE[captured[1]] - MVV_LVA_VALUE[board[(move >> 3) & 7][move & 7][1]]
+            flag = move >> 12
+            if flag == MOVE_ENPASSANT:
+                return 100000 + 10 * MVV_LVA_VALUE["P"] - MVV_LVA_VALUE["P"]
+            if flag >= MOVE_PROMOTION:
+                return 95000 + flag  # * queen promotion first
+            if move == killers[0]:
+                return 90000
+            if move == killers[1]:
+                return 80000
+            return history[move & 0xFFF]
+        return sorted(moves, key=moveOrder, reverse=True)
+
+
+# ? the side to move has a piece besides pawns and the king, null move pruning is unsafe without one
+def hasPieces(gs):
+    color = "w" if gs.whiteToMove else "b"
+    for row in gs.board:
+        for piece in row:
+            if piece[0] == color and piece[1] in "NBRQ":
+                return True
+    return False
+
+
+# ? static exchange evaluation: material won (or lost) by move if both sides keep recapturing
+# ? on its end square with their least valuable attacker
+def staticExchange(gs, move):
+    startRow, startCol = (move >> 3) & 7, move & 7
+    r, c = (move >> 9) & 7, (move >> 6) & 7
+    pieceMove = gs.board[startRow][startCol]
+    pieceCaptured = gs.board[r][c]
+    ignored = {(startRow, startCol)}
+    if move >> 12 == MOVE_ENPASSANT:
+        pieceCaptured = "P"
+        ignored.add((startRow, c))
+    gain = [SEE_VALUE[pieceCaptured[-1]] if pieceCaptured != "--" else 0]
+    onSquare = SEE_VALUE[pieceMove[1]]  # * value of the piece that can be taken next
+    side = "b" if pieceMove[0] == "w" else "w"
+    while True:
+        attacker = gs.getLeastValuableAttacker(r, c, side, ignored)
+        if attacker is None:
+            break
+        other = "b" if side == "w" else "w"
+        if attacker[2][1] == "K" and gs.getLeastValuableAttacker(r, c, other, ignored | {attacker[:2]}) is not None:
+            break  # * the king cannot capture on a defended square
+        gain.append(onSquare - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            break  # * neither side wants to continue the exchange
+        ignored.add(attacker[:2])
+        onSquare = SEE_VALUE[attacker[2][1]]
+        side = other
+    for d in range(len(gain) - 1, 0, -1):
+        gain[d - 1] = -max(-gain[d - 1], gain[d])
+    return gain[0]
+
+
+# * mate scores are stored relative to the node, so a mate found through a transposition keeps its distance
+def scoreToTT(score, ply):
+    if score > CHECKMATE - MAX_PLY:
+        return score + ply
+    if score < -CHECKMATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):
+    if score > CHECKMATE - MAX_PLY:
+        return score - ply
+    if score < -CHECKMATE + MAX_PLY:
+        return score + ply
+    return score
 
 
 def scoreBoard(gs):
@@ -57,14 +558,7 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.staleMate:
         return STALEMATE
-    score = 0
-    for row in gs.board:
-        for square in row:
-            if square[0] == 'w':
-                score += piceScore[square[1]]
-            elif square[0] == 'b':
-                score -= piceScore[square[1]]
-    return score
+    return gs.getEvaluation()
 
 
 def findBestMove(gs, validMoves):
@@ -74,7 +568,7 @@ def findBestMove(gs, validMoves):
     random.shuffle(validMoves)
     for playerMove in validMoves:
         gs.makeMove(playerMove)
-        opponentMoves = gs.getValidMoves()
+        opponentMoves = gs.getLegalMoves()
         if gs.checkMate:
             score = -turnMultiplier * CHECKMATE
         elif gs.staleMate:
@@ -82,14 +576,14 @@ def findBestMove(gs, validMoves):
         else:
             opponentMaxScore = -CHECKMATE
             for opponentMove in opponentMoves:
-                gs.makeMove(opponentMove)
-                gs.getValidMoves()
+                gs.makePackedMove(opponentMove)
+                gs.getLegalMoves()
                 if gs.checkMate:
                     score = CHECKMATE
                 elif gs.staleMate:
                     score = STALEMATE
                 else:
-                    score = scoreMaterial(gs.board) * -turnMultiplier
+                    score = gs.getEvaluation() * -turnMultiplier
                 if score > opponentMaxScore:
                     opponentMaxScore = score
                 gs.undoMove()
@@ -100,12 +594,6 @@ def findBestMove(gs, validMoves):
     return bestPlayerMove
 
 
+# ? evaluation of a bare board from scratch, the search uses the incremental GameState.getEvaluation
 def scoreMaterial(board):
-    score = 0
-    for row in board:
-        for square in row:
-            if square[0] == 'w':
-                score += piceScore[square[1]]
-            elif square[0] == 'b':
-                score -= piceScore[square[1]]
-    return score
+    return chessEval.taper(*chessEval.evaluateBoard(board))
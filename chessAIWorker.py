@@ -0,0 +1,114 @@
+
+# ? runs the chessAI search in a background process, so the pygame loop keeps drawing while the AI thinks
+# ? the worker keeps one Searcher (and its transposition table) for the whole game, so pondering on the
+# ? human's time fills the table the next real search starts from
+# * the position is sent as the starting FEN plus the packed moves played since, the worker replays them
+
+import multiprocessing
+import queue
+import chessAI
+from ChessEngine import START_FEN, getPackedNotation
+
+
+# ? body of the background process: wait for a search, run it and report progress and the result
+# * wantedID is the id of the search the main process wants, a running search stops as soon as it changes
+def workerLoop(gameClass, commands, results, wantedID):
+    searcher = chessAI.Searcher(chessAI.transpositionTable)
+    while True:
+        command = commands.get()
+        if command is None:
+            break
+        searchID, startFen, moves, timeLimit, kind = command
+        if wantedID.value != searchID:
+            continue  # * cancelled before it started
+        gs = gameClass.fromFen(startFen)
+        for move in moves:
+            gs.makePackedMove(move)
+
+        def progress(result):
+            results.put(("progress", searchID, kind, result.depth, result.score,
+                         getPackedNotation(result.move) if result.move is not None else "",
+                         result.nodes, result.elapsed))
+        if kind == "search":
+            bookMove = chessAI.findBookMove(gs)
+            if bookMove is not None:
+                results.put(("done", searchID, kind, bookMove, 0, 0, [bookMove]))
+                continue
+        searcher.onIteration = progress
+        searcher.shouldStop = lambda: wantedID.value != searchID
+        result = searcher.think(gs, timeLimit=timeLimit)
+        results.put(("done", searchID, kind, result.move, result.score, result.depth, result.pv))
+
+
+class AIWorker():
+    def __init__(self, gameClass, startFen=START_FEN):
+        self.startFen = startFen
+        self.commands = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.wantedID = multiprocessing.Value('i', 0)
+        self.searchID = 0
+        self.kind = None  # * "search" or "ponder" while a search is running
+        self.progress = None  # * (depth, score, move, nodes per second) of the last finished depth
+        self.ponderMove = None  # * the reply the last search expects, pondered on next
+        self.process = multiprocessing.Process(target=workerLoop, args=(
+            gameClass, self.commands, self.results, self.wantedID), daemon=True)
+        self.process.start()
+
+    def isThinking(self):
+        return self.kind == "search"
+
+    def isPondering(self):
+        return self.kind == "ponder"
+
+    # ? start searching gs for the side to move, any running search is cancelled
+    def startSearch(self, gs, timeLimit=chessAI.TIME_LIMIT):
+        self.start(list(gs.movelog), timeLimit, "search")
+
+    # ? think on the opponent's time: search the position after the expected reply, or gs itself, until cancelled
+    def ponder(self, gs, ponderMove=None):
+        moves = list(gs.movelog)
+        if ponderMove is not None and ponderMove in gs.getLegalMoves():
+            moves.append(ponderMove)
+        self.start(moves, None, "ponder")
+
+    def start(self, moves, timeLimit, kind):
+        self.searchID += 1
+        self.wantedID.value = self.searchID
+        self.kind = kind
+        self.progress = None
+        self.commands.put((self.searchID, self.startFen, moves, timeLimit, kind))
+
+    # ? stop whatever is running, its result will be ignored
+    def cancel(self):
+        self.searchID += 1
+        self.wantedID.value = self.searchID
+        self.kind = None
+        self.progress = None
+
+    # ? the packed best move once the current search is done, None while it is still running
+    # * call once per frame, it also picks up the progress reports
+    def poll(self):
+        bestMove = None
+        while True:
+            try:
+                message = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if message[1] != self.searchID:
+                continue  # * from a cancelled search
+            if message[0] == "progress":
+                depth, score, move, nodes, elapsed = message[3:]
+                self.progress = (depth, score, move, int(nodes / elapsed) if elapsed > 0 else 0)
+            elif message[2] == "search":
+                bestMove = message[3]
+                pv = message[6]
+                self.ponderMove = pv[1] if len(pv) > 1 else None
+                self.kind = None
+        return bestMove
+
+    def close(self):
+        self.cancel()
+        self.commands.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,244 @@
+
+# ? headless batch analysis: stream FEN lines or PGN games, search every position and write one JSON line per position
+# ? positions are fanned out to a process pool with a bounded number in flight, results come back in input order
+# ? a checkpoint file records how many positions are done and how long the output was at that point,
+# ? --resume cuts the output back to that length, skips the done positions and carries on appending
+# * python chessBatch.py positions.fen --depth 4 --workers 8 --out results.jsonl
+# * cat games.pgn | python chessBatch.py - --format pgn --time 0.5 --checkpoint run.ckpt --out results.jsonl
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+import ChessEngine
+import chessAI
+import chessBitboard
+import chessPGN
+import chessStats
+from ChessEngine import getPackedNotation
+
+GAME_STATES = {"board": ChessEngine.GameState, "bitboard": chessBitboard.BitboardGameState}
+CHECKPOINT_EVERY = 100  # * positions between checkpoint writes
+
+# * state of a worker process, set up once by initWorker
+_worker = {}
+
+
+def initWorker(ttSizeMB, gameClass, collectStats=False):
+    stats = chessStats.SearchStats() if collectStats else None
+    _worker["searcher"] = chessAI.Searcher(chessAI.chessTT.TranspositionTable(ttSizeMB), stats)
+    _worker["gameClass"] = gameClass
+
+
+# ? (record, error) pairs in input order, a record is a dict with at least id and fen
+# * pgn games become one record per position before every move and after the last one
+def readRecords(lines, format):
+    index = 0
+    if format == "fen":
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            yield {"id": index, "fen": line.split(";")[0].strip()}, None
+            index += 1
+        return
+    for gameNumber, (headers, sanMoves) in enumerate(chessPGN.readGames(lines)):
+        records = []
+
+        def visit(gs, ply):
+            records.append({"id": None, "fen": gs.toFen(), "game": gameNumber, "ply": ply})
+        error = None
+        try:
+            chessPGN.replayGame(ChessEngine.GameState, headers, sanMoves, visit)
+        except ValueError as e:
+            error = "game " + str(gameNumber) + ": " + str(e)
+        for record in records:
+            record["id"] = index
+            index += 1
+            yield record, None
+        if error is not None:
+            yield {"id": index, "fen": None, "game": gameNumber}, error
+            index += 1
+
+
+# ? search one record, returns the output line as a dict
+def analyse(record, depth, timeLimit, nodeLimit):
+    result = dict(record)
+    try:
+        gs = _worker["gameClass"].fromFen(record["fen"])
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+    found = _worker["searcher"].think(gs, depth, timeLimit, nodeLimit)
+    result["bestmove"] = getPackedNotation(found.move) if found.move is not None else None
+    result["score"] = found.score
+    if found.move is None:  # * nothing to search, the game is over
+        result["score"] = -chessAI.CHECKMATE if gs.checkMate else chessAI.STALEMATE
+    result["depth"] = found.depth
+    result["nodes"] = found.nodes
+    result["time"] = round(found.elapsed, 4)
+    result["pv"] = [getPackedNotation(move) for move in found.pv]
+    if _worker["searcher"].stats is not None:
+        result["stats"] = _worker["searcher"].stats.toDict()
+    return result
+
+
+def readCheckpoint(path):
+    if path is None or not os.path.exists(path):
+        return {"done": 0, "nodes": 0, "seconds": 0.0, "outputBytes": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+# * written to a temporary file first so a crash never leaves half a checkpoint
+def writeCheckpoint(path, checkpoint):
+    if path is None:
+        return
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+class BatchRunner():
+    def __init__(self, workers=1, depth=chessAI.MAX_PLY - 1, timeLimit=None, nodeLimit=None,
+                 gameClass=ChessEngine.GameState, ttSizeMB=chessAI.TT_SIZE_MB, maxInFlight=None, collectStats=False):
+        self.workers = max(1, workers)
+        self.depth = depth
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.gameClass = gameClass
+        self.ttSizeMB = ttSizeMB
+        self.maxInFlight = maxInFlight if maxInFlight is not None else 2 * self.workers
+        self.collectStats = collectStats  # * add the chessStats counters of every search to its output line
+        self.positions = 0
+        self.nodes = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    # ? analyse every record and hand each output line to write in input order
+    # * at most maxInFlight positions are queued or running, so memory does not grow with the input
+    # * outputBytes is called before every checkpoint and should flush the output and return its length
+    def run(self, records, write, checkpoint=None, checkpointPath=None, outputBytes=None):
+        checkpoint = checkpoint if checkpoint is not None else readCheckpoint(None)
+        startTime = time.perf_counter()
+        secondsBefore = checkpoint["seconds"]
+
+        def finish(line):
+            write(line)
+            self.positions += 1
+            self.nodes += line.get("nodes", 0)
+            self.errors += "error" in line
+            checkpoint["done"] += 1
+            checkpoint["nodes"] += line.get("nodes", 0)
+            checkpoint["seconds"] = secondsBefore + time.perf_counter() - startTime
+            if checkpoint["done"] % CHECKPOINT_EVERY == 0:
+                saveCheckpoint()
+
+        def saveCheckpoint():
+            if outputBytes is not None:
+                checkpoint["outputBytes"] = outputBytes()
+            writeCheckpoint(checkpointPath, checkpoint)
+
+        if self.workers == 1:
+            initWorker(self.ttSizeMB, self.gameClass, self.collectStats)
+            for record, error in records:
+                finish(dict(record, error=error) if error else analyse(record, self.depth, self.timeLimit, self.nodeLimit))
+        else:
+            pool = multiprocessing.Pool(self.workers, initializer=initWorker,
+                                        initargs=(self.ttSizeMB, self.gameClass, self.collectStats))
+            try:
+                inFlight = collections.deque()
+                for record, error in records:
+                    if error:
+                        inFlight.append(dict(record, error=error))
+                    else:
+                        inFlight.append(pool.apply_async(analyse, (record, self.depth, self.timeLimit, self.nodeLimit)))
+                    while len(inFlight) >= self.maxInFlight:  # * backpressure: wait for the oldest before reading on
+                        finish(self.collect(inFlight.popleft()))
+                while inFlight:
+                    finish(self.collect(inFlight.popleft()))
+            finally:
+                pool.terminate()
+                pool.join()
+        saveCheckpoint()
+        self.elapsed = time.perf_counter() - startTime
+        return checkpoint
+
+    @staticmethod
+    def collect(pending):
+        return pending if isinstance(pending, dict) else pending.get()
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return {"positions": self.positions, "errors": self.errors, "nodes": self.nodes,
+                "seconds": round(self.elapsed, 3), "positionsPerSecond": round(self.positions / elapsed, 2),
+                "nodesPerSecond": int(self.nodes / elapsed)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="search many positions and write JSON lines")
+    parser.add_argument("input", help="FEN or PGN file, - for stdin")
+    parser.add_argument("--format", choices=("auto", "fen", "pgn"), default="auto")
+    parser.add_argument("--out", default=None, help="JSON lines output, stdout if not given")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time", type=float, default=None, help="seconds per position")
+    parser.add_argument("--nodes", type=int, default=None, help="nodes per position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--queue", type=int, default=None, help="positions in flight, 2 per worker by default")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState")
+    parser.add_argument("--hash", type=int, default=chessAI.TT_SIZE_MB, help="transposition table MB per worker")
+    parser.add_argument("--checkpoint", default=None, help="file recording progress")
+    parser.add_argument("--resume", action="store_true", help="skip the positions done in --checkpoint")
+    parser.add_argument("--stats", action="store_true", help="add search counters and phase times to every line")
+    args = parser.parse_args(argv)
+    if args.depth is None and args.time is None and args.nodes is None:
+        args.depth = chessAI.DEPTH
+    if args.resume and (args.checkpoint is None or args.out is None):
+        parser.error("--resume needs --checkpoint and --out")
+
+    inputFile = sys.stdin if args.input == "-" else open(args.input)
+    format = args.format
+    if format == "auto":
+        format = "pgn" if args.input.endswith(".pgn") else "fen"
+    checkpoint = readCheckpoint(args.checkpoint) if args.resume else None
+    records = readRecords(inputFile, format)
+    if checkpoint is not None:
+        for _ in zip(range(checkpoint["done"]), records):
+            pass  # * already in the output
+    if args.out:
+        output = open(args.out, "r+" if args.resume and os.path.exists(args.out) else "w")
+        if checkpoint is not None:
+            # * drop the lines written after the last checkpoint, they are searched again
+            output.truncate(checkpoint.get("outputBytes", 0))
+            output.seek(0, os.SEEK_END)
+    else:
+        output = sys.stdout
+
+    def write(line):
+        output.write(json.dumps(line) + "\n")
+        if args.out is None:
+            output.flush()
+
+    def outputBytes():
+        output.flush()
+        return output.tell() if output is not sys.stdout else 0
+
+    runner = BatchRunner(args.workers, args.depth if args.depth is not None else chessAI.MAX_PLY - 1, args.time,
+                         args.nodes, GAME_STATES["bitboard" if args.bitboard else "board"], args.hash, args.queue,
+                         args.stats)
+    try:
+        runner.run(records, write, checkpoint, args.checkpoint, outputBytes)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if inputFile is not sys.stdin:
+            inputFile.close()
+    print(json.dumps(runner.summary()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,510 @@
+
+# ? Bitboard backed version of ChessEngine.GameState
+# ? every piece type of every color is kept as a 64 bit integer, plus one occupancy set per color
+# ? squares are numbered row*8 + col, so bit 0 is a8 and bit 63 is h1 (same orientation as GameState.board)
+# ? move generation, legality (pins, checks, castling, en passant), attack queries and SEE work on the piece sets,
+# ? make/undo flip their bits straight from the move; board stays beside them as a mailbox, the piece on a
+# ? square in O(1), for the evaluation, the move ordering and the UI
+
+from array import array
+import ChessEngine
+from ChessEngine import KNIGHT_OFFSETS, KING_OFFSETS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+from ChessEngine import MOVE_DOUBLE_PUSH, MOVE_CASTLE, MOVE_ENPASSANT, MOVE_PROMOTION, NULL_MOVE
+from ChessEngine import PIECE_CODES, PROMOTION_PIECES
+
+PIECES = ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK',
+          'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+
+# * the rows pawns start on (white and black)
+RANK_2 = 0xFF << 48
+RANK_7 = 0xFF << 8
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def _leaperTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= squareBit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaperTable(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaperTable(KING_OFFSETS)
+# * squares attacked by a pawn of the given color standing on sq
+PAWN_ATTACKS = {'w': _leaperTable(((-1, -1), (-1, 1))),
+                'b': _leaperTable(((1, -1), (1, 1)))}
+
+
+def _betweenTable():
+    # * BETWEEN[a][b]: the squares strictly between a and b when they share a rank, file or diagonal, else 0
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            between = 0
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                table[sq][endRow * 8 + endCol] = between
+                between |= squareBit(endRow, endCol)
+                endRow += dr
+                endCol += dc
+    return table
+
+
+BETWEEN = _betweenTable()
+# * castling: (right, squares that must be empty, squares the king crosses) by color, king side first
+CASTLES = {'w': (('wks', 3 << 61, (61, 62)), ('wqs', 7 << 57, (59, 58))),
+           'b': (('bks', 3 << 5, (5, 6)), ('bqs', 7 << 1, (3, 2)))}
+
+
+def _slidingAttacks(sq, occupancy, directions):
+    r, c = divmod(sq, 8)
+    attacks = 0
+    for dr, dc in directions:
+        endRow, endCol = r + dr, c + dc
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            bit = squareBit(endRow, endCol)
+            attacks |= bit
+            if occupancy & bit:
+                break
+            endRow += dr
+            endCol += dc
+    return attacks
+
+
+def _relevantMask(sq, directions):
+    # * the squares whose occupancy can change the attack set (the board edge never blocks anything)
+    r, c = divmod(sq, 8)
+    mask = 0
+    for dr, dc in directions:
+        endRow, endCol = r + dr, c + dc
+        while 0 <= endRow + dr < 8 and 0 <= endCol + dc < 8:
+            mask |= squareBit(endRow, endCol)
+            endRow += dr
+            endCol += dc
+    return mask
+
+
+def _sliderTable(directions):
+    # ? occupancy indexed lookup: for every square, every subset of its relevant mask maps to an attack set
+    # * this is the magic bitboard idea, with python's dict hashing doing the work of the magic multiply
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = _relevantMask(sq, directions)
+        table = {}
+        subset = 0
+        while True:  # * carry-rippler walk over all subsets of mask
+            table[subset] = _slidingAttacks(sq, subset, directions)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = [], []
+BISHOP_MASKS, BISHOP_TABLES = [], []
+
+
+def initSliderTables():
+    # * built on first use, the rook tables take a moment to fill
+    if not ROOK_TABLES:
+        masks, tables = _sliderTable(ROOK_DIRECTIONS)
+        ROOK_MASKS.extend(masks)
+        ROOK_TABLES.extend(tables)
+        masks, tables = _sliderTable(BISHOP_DIRECTIONS)
+        BISHOP_MASKS.extend(masks)
+        BISHOP_TABLES.extend(tables)
+
+
+def rookAttacks(sq, occupancy):
+    return ROOK_TABLES[sq][occupancy & ROOK_MASKS[sq]]
+
+
+def bishopAttacks(sq, occupancy):
+    return BISHOP_TABLES[sq][occupancy & BISHOP_MASKS[sq]]
+
+
+def iterBits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def __init__(self):
+        super().__init__()
+        initSliderTables()
+        self.loadBitboards()
+
+    def loadFen(self, fen):
+        super().loadFen(fen)
+        self.loadBitboards()
+
+    # ? rebuild the bitboards from the board, after the board was set up by hand
+    def loadBitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= squareBit(r, c)
+                    self.occupancy[piece[0]] |= squareBit(r, c)
+
+    # ? flip the bits a packed move changes, doing it again takes the move back
+    # * piece is the piece that moved (the pawn for a promotion), captured what stood on the end square
+    def togglePieces(self, piece, captured, startSq, endSq, flag):
+        bb = self.bitboards
+        occupancy = self.occupancy
+        color = piece[0]
+        startBit = 1 << startSq
+        endBit = 1 << endSq
+        if flag >= MOVE_PROMOTION:
+            bb[piece] ^= startBit
+            bb[color + PROMOTION_PIECES[flag - MOVE_PROMOTION]] ^= endBit
+        else:
+            bb[piece] ^= startBit | endBit
+        occupancy[color] ^= startBit | endBit
+        if flag == MOVE_ENPASSANT:
+            capturedBit = 1 << ((startSq & ~7) | (endSq & 7))
+            enemy = 'b' if color == 'w' else 'w'
+            bb[enemy + 'P'] ^= capturedBit
+            occupancy[enemy] ^= capturedBit
+        elif captured != "--":
+            bb[captured] ^= endBit
+            occupancy[captured[0]] ^= endBit
+        elif flag == MOVE_CASTLE:
+            rookBits = 1 << (endSq + 1) | 1 << (endSq - 1) if endSq > startSq else 1 << (endSq - 2) | 1 << (endSq + 1)
+            bb[color + 'R'] ^= rookBits
+            occupancy[color] ^= rookBits
+
+    def makePackedMove(self, move):
+        startSq = move & 63
+        endSq = (move >> 6) & 63
+        board = self.board
+        piece = board[startSq >> 3][startSq & 7]
+        captured = board[endSq >> 3][endSq & 7]
+        super().makePackedMove(move)
+        self.togglePieces(piece, captured, startSq, endSq, move >> 12)
+
+    def undoMove(self):
+        if len(self.movelog) != 0:
+            move = self.movelog[-1]
+            if move == NULL_MOVE:
+                super().undoMove()
+                return
+            startSq = move & 63
+            endSq = (move >> 6) & 63
+            flag = move >> 12
+            piece = self.board[endSq >> 3][endSq & 7]
+            if flag >= MOVE_PROMOTION:
+                piece = piece[0] + 'P'
+            captured = PIECE_CODES[self.undoLog[-1] & 15]
+            super().undoMove()
+            self.togglePieces(piece, captured, startSq, endSq, flag)
+
+    # ? is square sq attacked by color byColor with the given occupancy
+    # * the occupancy can leave pieces out, so the king does not shield the squares behind it
+    def isAttackedWith(self, sq, byColor, occupied):
+        bb = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bb[byColor + 'N']:
+            return True
+        # * a pawn of byColor attacks sq if a pawn of the other color on sq would attack it back
+        if PAWN_ATTACKS['b' if byColor == 'w' else 'w'][sq] & bb[byColor + 'P']:
+            return True
+        if KING_ATTACKS[sq] & bb[byColor + 'K']:
+            return True
+        queens = bb[byColor + 'Q']
+        if rookAttacks(sq, occupied) & (bb[byColor + 'R'] | queens):
+            return True
+        if bishopAttacks(sq, occupied) & (bb[byColor + 'B'] | queens):
+            return True
+        return False
+
+    # ? determine if any piece of color byColor attacks the square (r,c)
+    def isSquareAttacked(self, r, c, byColor):
+        return self.isAttackedWith(r * 8 + c, byColor, self.occupancy['w'] | self.occupancy['b'])
+
+    # ? the cheapest piece of color byColor attacking (r,c) as (row, col, piece), or None
+    # * squares in ignored count as empty, so static exchange evaluation can see x-ray attackers
+    def getLeastValuableAttacker(self, r, c, byColor, ignored=()):
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        for row, col in ignored:
+            occupied &= ~squareBit(row, col)
+        sq = r * 8 + c
+        bb = self.bitboards
+        bishops = bishopAttacks(sq, occupied)
+        rooks = rookAttacks(sq, occupied)
+        for type, attacks in (('P', PAWN_ATTACKS['b' if byColor == 'w' else 'w'][sq]), ('N', KNIGHT_ATTACKS[sq]),
+                              ('B', bishops), ('R', rooks), ('Q', bishops | rooks), ('K', KING_ATTACKS[sq])):
+            attackers = attacks & bb[byColor + type] & occupied
+            if attackers:
+                attackerSq = (attackers & -attackers).bit_length() - 1
+                return (attackerSq >> 3, attackerSq & 7, byColor + type)
+        return None
+
+    # ? every square attacked by color byColor as one bitboard, sliders blocked by occupied
+    def getAttackedBitboard(self, byColor, occupied=None):
+        bb = self.bitboards
+        if occupied is None:
+            occupied = self.occupancy['w'] | self.occupancy['b']
+        attacked = 0
+        pawnAttacks = PAWN_ATTACKS[byColor]
+        for sq in iterBits(bb[byColor + 'P']):
+            attacked |= pawnAttacks[sq]
+        for sq in iterBits(bb[byColor + 'N']):
+            attacked |= KNIGHT_ATTACKS[sq]
+        for sq in iterBits(bb[byColor + 'B'] | bb[byColor + 'Q']):
+            attacked |= bishopAttacks(sq, occupied)
+        for sq in iterBits(bb[byColor + 'R'] | bb[byColor + 'Q']):
+            attacked |= rookAttacks(sq, occupied)
+        for sq in iterBits(bb[byColor + 'K']):
+            attacked |= KING_ATTACKS[sq]
+        return attacked
+
+    def getAttackedSquares(self, byColor):
+        attacked = self.getAttackedBitboard(byColor)
+        return [[bool(attacked >> (r * 8 + c) & 1) for c in range(8)] for r in range(8)]
+
+    # ? pins and checks of the side to move from the piece sets
+    # * returns (king square, king row, king col, squares a non king move must end on, pinned square -> the line
+    # * it may move on, double check, in check) and sets inCheck
+    def getLegalityContext(self):
+        color = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        bb = self.bitboards
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[enemy]
+        kingSq = bb[color + 'K'].bit_length() - 1
+        checkers = (KNIGHT_ATTACKS[kingSq] & bb[enemy + 'N']) | (PAWN_ATTACKS[color][kingSq] & bb[enemy + 'P'])
+        queens = bb[enemy + 'Q']
+        # * every enemy slider on a line with the king: nothing between is a check, one own piece between is a pin
+        sliders = (rookAttacks(kingSq, 0) & (bb[enemy + 'R'] | queens)) | \
+            (bishopAttacks(kingSq, 0) & (bb[enemy + 'B'] | queens))
+        between = BETWEEN[kingSq]
+        pinLines = {}
+        for sq in iterBits(sliders):
+            blockers = between[sq] & occupied
+            if not blockers:
+                checkers |= 1 << sq
+            elif blockers & (blockers - 1) == 0 and blockers & own:
+                pinLines[blockers.bit_length() - 1] = between[sq] | 1 << sq
+        self.inCheck = checkers != 0
+        doubleCheck = checkers & (checkers - 1) != 0
+        if not checkers:
+            evasions = FULL_BOARD
+        elif doubleCheck:
+            evasions = 0
+        else:  # * capture the checker or block the line to it
+            evasions = checkers | between[checkers.bit_length() - 1]
+        return kingSq, kingSq >> 3, kingSq & 7, evasions, pinLines, doubleCheck, self.inCheck
+
+    # ? does the pseudo legal move leave the own king safe, context from getLegalityContext
+    def isLegalMove(self, move, context):
+        kingSq, kingRow, kingCol, evasions, pinLines, doubleCheck, inCheck = context
+        startSq = move & 63
+        endSq = (move >> 6) & 63
+        flag = move >> 12
+        if flag == MOVE_ENPASSANT:
+            return self.isEnpassantLegal(move)
+        if startSq == kingSq:
+            if flag == MOVE_CASTLE:
+                return True  # * getCastleMoves already checked the squares the king crosses
+            occupied = self.occupancy['w'] | self.occupancy['b']
+            return not self.isAttackedWith(endSq, 'b' if self.whiteToMove else 'w', occupied ^ 1 << kingSq)
+        if doubleCheck or not evasions >> endSq & 1:
+            return False
+        line = pinLines.get(startSq)
+        return line is None or line >> endSq & 1 == 1
+
+    # ? en passant takes two pawns off one rank, so test the king with both gone and the capturer on its new square
+    def isEnpassantLegal(self, move):
+        color = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        startSq = move & 63
+        endSq = (move >> 6) & 63
+        capturedBit = 1 << ((startSq & ~7) | (endSq & 7))
+        bb = self.bitboards
+        occupied = (self.occupancy['w'] | self.occupancy['b']) ^ 1 << startSq ^ capturedBit | 1 << endSq
+        kingSq = bb[color + 'K'].bit_length() - 1
+        queens = bb[enemy + 'Q']
+        return not (rookAttacks(kingSq, occupied) & (bb[enemy + 'R'] | queens) or
+                    bishopAttacks(kingSq, occupied) & (bb[enemy + 'B'] | queens) or
+                    KNIGHT_ATTACKS[kingSq] & bb[enemy + 'N'] or
+                    PAWN_ATTACKS[color][kingSq] & bb[enemy + 'P'] & ~capturedBit)
+
+    # ? the legal moves straight from the piece sets: pinned pieces stay on their line, in check every move has
+    # ? to capture or block the checker, the king only steps to squares the enemy does not attack
+    def generateLegalMoves(self):
+        kingSq, kingRow, kingCol, evasions, pinLines, doubleCheck, inCheck = self.getLegalityContext()
+        color = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        bb = self.bitboards
+        own = self.occupancy[color]
+        enemies = self.occupancy[enemy]
+        occupied = own | enemies
+        moves = array('H')
+
+        # * the king is left out of the occupancy so it cannot step back along the line of a slider checking it
+        danger = self.getAttackedBitboard(enemy, occupied ^ 1 << kingSq)
+        self.addMoves(kingSq, KING_ATTACKS[kingSq] & ~own & ~danger, moves)
+        if not doubleCheck:
+            pinned = 0
+            for sq in pinLines:
+                pinned |= 1 << sq
+            targets = ~own & evasions
+            empty = ~occupied & FULL_BOARD
+            pawns = bb[color + 'P']
+            self.addPawnMoves(pawns & ~pinned, color, empty, enemies, moves, evasions)
+            for sq in iterBits(pawns & pinned):
+                self.addPawnMoves(1 << sq, color, empty, enemies, moves, evasions & pinLines[sq])
+            if self.enpassantPossible != ():
+                enpassantMoves = array('H')
+                self.addEnpassantMoves(pawns, color, enpassantMoves)
+                for move in enpassantMoves:
+                    if self.isEnpassantLegal(move):
+                        moves.append(move)
+            for sq in iterBits(bb[color + 'N'] & ~pinned):  # * a pinned knight can never move
+                self.addMoves(sq, KNIGHT_ATTACKS[sq] & targets, moves)
+            queens = bb[color + 'Q']
+            for sq in iterBits(bb[color + 'B'] | queens):
+                attacks = bishopAttacks(sq, occupied) & targets
+                if pinned >> sq & 1:
+                    attacks &= pinLines[sq]
+                self.addMoves(sq, attacks, moves)
+            for sq in iterBits(bb[color + 'R'] | queens):
+                attacks = rookAttacks(sq, occupied) & targets
+                if pinned >> sq & 1:
+                    attacks &= pinLines[sq]
+                self.addMoves(sq, attacks, moves)
+            if not inCheck:
+                self.getCastleMoves(kingRow, kingCol, moves)
+
+        if len(moves) == 0:  # either checkmate or stalemate
+            self.checkMate = inCheck
+            self.staleMate = not inCheck
+        else:
+            self.staleMate = False
+            self.checkMate = False
+        return moves
+
+    # ? Get all possible Moves, from the bitboards instead of scanning the board
+    def getAllPossibleMoves(self):
+        moves = array('H')
+        color = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        bb = self.bitboards
+        own = self.occupancy[color]
+        enemies = self.occupancy[enemy]
+        occupied = own | enemies
+        empty = ~occupied & FULL_BOARD
+
+        self.addPawnMoves(bb[color + 'P'], color, empty, enemies, moves)
+        self.addEnpassantMoves(bb[color + 'P'], color, moves)
+        for sq in iterBits(bb[color + 'N']):
+            self.addMoves(sq, KNIGHT_ATTACKS[sq] & ~own, moves)
+        for sq in iterBits(bb[color + 'B'] | bb[color + 'Q']):
+            self.addMoves(sq, bishopAttacks(sq, occupied) & ~own, moves)
+        for sq in iterBits(bb[color + 'R'] | bb[color + 'Q']):
+            self.addMoves(sq, rookAttacks(sq, occupied) & ~own, moves)
+        for sq in iterBits(bb[color + 'K']):
+            self.addMoves(sq, KING_ATTACKS[sq] & ~own, moves)
+        return moves
+
+    # ? castling for the king on (r,c): the right, empty squares to the rook and no attacked square on the way
+    def getCastleMoves(self, r, c, moves):
+        color = 'w' if self.whiteToMove else 'b'
+        enemy = 'b' if self.whiteToMove else 'w'
+        kingSq = r * 8 + c
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        rights = self.currentCasltingRight
+        if self.isAttackedWith(kingSq, enemy, occupied):
+            return  # * cant caslte if king in check
+        for right, empty, crossed in CASTLES[color]:
+            if getattr(rights, right) and not occupied & empty and \
+                    not self.isAttackedWith(crossed[0], enemy, occupied) and \
+                    not self.isAttackedWith(crossed[1], enemy, occupied):
+                moves.append(kingSq | crossed[1] << 6 | MOVE_CASTLE << 12)
+
+    # ? is a move the side to move can make ignoring checks, generated for the one piece on its start square
+    def isPseudoMove(self, move, context):
+        startSq = move & 63
+        color = 'w' if self.whiteToMove else 'b'
+        own = self.occupancy[color]
+        if not own >> startSq & 1:
+            return False
+        bb = self.bitboards
+        enemies = self.occupancy['b' if self.whiteToMove else 'w']
+        occupied = own | enemies
+        moves = array('H')
+        startBit = 1 << startSq
+        if bb[color + 'P'] & startBit:
+            self.addPawnMoves(startBit, color, ~occupied & FULL_BOARD, enemies, moves)
+            self.addEnpassantMoves(startBit, color, moves)
+        elif bb[color + 'N'] & startBit:
+            self.addMoves(startSq, KNIGHT_ATTACKS[startSq] & ~own, moves)
+        elif bb[color + 'K'] & startBit:
+            self.addMoves(startSq, KING_ATTACKS[startSq] & ~own, moves)
+            if not context[6]:
+                self.getCastleMoves(startSq >> 3, startSq & 7, moves)
+        else:
+            targets = 0
+            if (bb[color + 'B'] | bb[color + 'Q']) & startBit:
+                targets |= bishopAttacks(startSq, occupied)
+            if (bb[color + 'R'] | bb[color + 'Q']) & startBit:
+                targets |= rookAttacks(startSq, occupied)
+            self.addMoves(startSq, targets & ~own, moves)
+        return move in moves
+
+    def addMoves(self, sq, targets, moves):
+        for end in iterBits(targets):
+            moves.append(sq | end << 6)
+
+    # * pushes and captures of the pawns, only those ending on targets; en passant is added separately
+    def addPawnMoves(self, pawns, color, empty, enemies, moves, targets=FULL_BOARD):
+        if color == 'w':
+            single = (pawns >> 8) & empty
+            double = ((single & (RANK_2 >> 8)) >> 8) & empty
+            step = -8
+            lastRank = 0xFF
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & (RANK_7 << 8)) << 8) & empty
+            step = 8
+            lastRank = 0xFF << 56
+        for end in iterBits(single & targets):
+            self.addPawnTarget(end - step, end, lastRank, moves)
+        for end in iterBits(double & targets):
+            moves.append((end - 2 * step) | end << 6 | MOVE_DOUBLE_PUSH << 12)
+        attacks = PAWN_ATTACKS[color]
+        for sq in iterBits(pawns):
+            for end in iterBits(attacks[sq] & enemies & targets):
+                self.addPawnTarget(sq, end, lastRank, moves)
+
+    def addEnpassantMoves(self, pawns, color, moves):
+        if self.enpassantPossible != ():
+            enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+            # * the pawns that could take on the square are where a pawn of the other color there would attack
+            for sq in iterBits(PAWN_ATTACKS['b' if color == 'w' else 'w'][enpassantSq] & pawns):
+                moves.append(sq | enpassantSq << 6 | MOVE_ENPASSANT << 12)
+
+    def addPawnTarget(self, start, end, lastRank, moves):
+        move = start | end << 6
+        if lastRank >> end & 1:
+            for flag in range(MOVE_PROMOTION, MOVE_PROMOTION + 4):
+                moves.append(move | flag << 12)
+        else:
+            moves.append(move)
@@ -0,0 +1,143 @@
+
+# ? opening book: a file of fixed size records (zobrist key, packed move, weight) sorted by key
+# ? the file is memory mapped and searched with a binary search, so a lookup never reads the whole book
+# ? the builder replays PGN games and counts the moves played in their first plies
+# * python chessBook.py build book.bin games.pgn [more.pgn ...] [--plies 20] [--min-weight 2]
+# * python chessBook.py probe book.bin [--fen "..."]
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import ChessEngine
+import chessPGN
+from ChessEngine import getPackedNotation
+
+# * 64 bit key, 16 bit packed move, 16 bit weight, 32 bits spare: 16 bytes, big endian so the file sorts by key
+RECORD = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xFFFF
+# * a move counts this much for the side that went on to win, a draw counts half
+RESULT_WEIGHT = {"win": 2, "draw": 1, "loss": 0}
+
+
+class OpeningBook():
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // RECORD.size
+        # * an empty file cannot be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def keyAt(self, index):
+        return RECORD.unpack_from(self.map, index * RECORD.size)[0]
+
+    # ? [(packed move, weight)] stored for the position key, empty if the position is not in the book
+    def findMoves(self, key):
+        low, high = 0, self.count
+        while low < high:  # * first record with a key >= key
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.count:
+            recordKey, move, weight, _ = RECORD.unpack_from(self.map, low * RECORD.size)
+            if recordKey != key:
+                break
+            moves.append((move, weight))
+            low += 1
+        return moves
+
+    # ? a book move for gs picked at random by weight, None when out of book
+    # * moves that are not legal here (a hash collision) are skipped
+    def chooseMove(self, gs, rng=random):
+        legalMoves = gs.getLegalMoves()
+        moves = [(move, weight) for move, weight in self.findMoves(gs.zobristKey) if weight > 0 and move in legalMoves]
+        if not moves:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in moves))
+        for move, weight in moves:
+            if pick < weight:
+                return move
+            pick -= weight
+        return None
+
+
+# ? count (key, move) weights over the first plies of every game in the pgn files and write the sorted book
+def buildBook(pgnPaths, outPath, plies=20, minWeight=1, out=sys.stdout):
+    weights = {}
+    games = skipped = 0
+    for pgnPath in pgnPaths:
+        with open(pgnPath) as pgnFile:
+            for headers, sanMoves in chessPGN.readGames(pgnFile):
+                result = headers.get("Result", "*")
+                if result == "*":
+                    skipped += 1
+                    continue
+                try:
+                    gs = ChessEngine.GameState.fromFen(headers.get("FEN", ChessEngine.START_FEN))
+                    for san in sanMoves[:plies]:
+                        move = chessPGN.parseSan(gs, san)
+                        if result == "1/2-1/2":
+                            outcome = "draw"
+                        else:
+                            outcome = "win" if (result == "1-0") == gs.whiteToMove else "loss"
+                        entry = (gs.zobristKey, move)
+                        weights[entry] = weights.get(entry, 0) + RESULT_WEIGHT[outcome]
+                        gs.makePackedMove(move)
+                except ValueError:
+                    skipped += 1
+                    continue
+                games += 1
+    records = sorted((key, move, min(weight, MAX_WEIGHT)) for (key, move), weight in weights.items()
+                     if weight >= minWeight)
+    with open(outPath, "wb") as book:
+        for key, move, weight in records:
+            book.write(RECORD.pack(key, move, weight, 0))
+    if out is not None:
+        print("games " + str(games) + " skipped " + str(skipped) + " records " + str(len(records)), file=out)
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build")
+    build.add_argument("book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--plies", type=int, default=20, help="book moves per game")
+    build.add_argument("--min-weight", type=int, default=1, help="drop rarer moves")
+    probe = commands.add_parser("probe")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=ChessEngine.START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        buildBook(args.pgn, args.book, args.plies, args.min_weight)
+        return 0
+    gs = ChessEngine.GameState.fromFen(args.fen)
+    with OpeningBook(args.book) as book:
+        moves = book.findMoves(gs.zobristKey)
+    total = sum(weight for _, weight in moves) or 1
+    for move, weight in sorted(moves, key=lambda entry: -entry[1]):
+        print(getPackedNotation(move) + " " + str(weight) + " " + str(round(100.0 * weight / total, 1)) + "%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+
+# ? evaluation tables: piece values and piece-square tables, for the middlegame and the endgame
+# ? GameState keeps the sum of these up to date in makeMove/undoMove, so evaluating a position is O(1)
+# * all scores are centipawns from white's point of view
+# * the tables are written from white's side, row 0 is the 8th rank like GameState.board
+
+PIECE_VALUE_MG = {"P": 82, "N": 337, "B": 365, "R": 477, "Q": 1025, "K": 0}
+PIECE_VALUE_EG = {"P": 94, "N": 281, "B": 297, "R": 512, "Q": 936, "K": 0}
+
+# * game phase: 24 with all minor and major pieces on the board, 0 with only kings and pawns
+PHASE_WEIGHT = {"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+MAX_PHASE = 24
+
+PST_MG_TABLES = {
+    "P": [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    "N": [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    "B": [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    "R": [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    "Q": [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    "K": [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20],
+}
+
+# * in the endgame pawns are worth more the closer they get, and the king belongs in the centre
+PST_EG_TABLES = dict(PST_MG_TABLES)
+PST_EG_TABLES["P"] = [0, 0, 0, 0, 0, 0, 0, 0,
+                      80, 80, 80, 80, 80, 80, 80, 80,
+                      50, 50, 50, 50, 50, 50, 50, 50,
+                      30, 30, 30, 30, 30, 30, 30, 30,
+                      20, 20, 20, 20, 20, 20, 20, 20,
+                      10, 10, 10, 10, 10, 10, 10, 10,
+                      10, 10, 10, 10, 10, 10, 10, 10,
+                      0, 0, 0, 0, 0, 0, 0, 0]
+PST_EG_TABLES["K"] = [-50, -40, -30, -20, -20, -30, -40, -50,
+                      -30, -20, -10, 0, 0, -10, -20, -30,
+                      -30, -10, 20, 30, 30, 20, -10, -30,
+                      -30, -10, 30, 40, 40, 30, -10, -30,
+                      -30, -10, 30, 40, 40, 30, -10, -30,
+                      -30, -10, 20, 30, 30, 20, -10, -30,
+                      -30, -30, 0, 0, 0, 0, -30, -30,
+                      -50, -30, -30, -30, -30, -30, -30, -50]
+
+
+def _signedTables(values, tables):
+    # * one 64 entry list per piece ("wN", "bQ" ...), value plus square bonus, negative for black
+    # * black reads the white table upside down
+    signed = {}
+    for type, table in tables.items():
+        signed["w" + type] = [values[type] + table[sq] for sq in range(64)]
+        signed["b" + type] = [-(values[type] + table[(7 - sq // 8) * 8 + sq % 8]) for sq in range(64)]
+    return signed
+
+
+PST_MG = _signedTables(PIECE_VALUE_MG, PST_MG_TABLES)
+PST_EG = _signedTables(PIECE_VALUE_EG, PST_EG_TABLES)
+PHASE = {color + type: weight for color in "wb" for type, weight in PHASE_WEIGHT.items()}
+
+
+# ? blend the middlegame and endgame scores by how much material is left
+def taper(mgScore, egScore, phase):
+    phase = min(phase, MAX_PHASE)
+    return (mgScore * phase + egScore * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+# ? (middlegame score, endgame score, phase) of a board, from scratch
+def evaluateBoard(board):
+    mgScore = egScore = phase = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                mgScore += PST_MG[piece][r * 8 + c]
+                egScore += PST_EG[piece][r * 8 + c]
+                phase += PHASE[piece]
+    return mgScore, egScore, phase
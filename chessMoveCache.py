@@ -0,0 +1,49 @@
+
+# ? least recently used cache of legal move lists, keyed by GameState.zobristKey
+# ? the key covers the side to move, the castling rights and a capturable en passant square,
+# ? so two positions with the same key have the same legal moves
+# * iterative deepening visits the same nodes again every iteration, those come out of here
+
+from array import array
+from collections import OrderedDict
+
+# * status bits stored with the moves, GameState sets its flags from them on a hit
+IN_CHECK = 1
+CHECKMATE = 2
+STALEMATE = 4
+
+
+class MoveCache():
+    def __init__(self, size=1 << 16):
+        self.size = max(1, size)
+        self.entries = OrderedDict()  # * key -> (packed moves, status bits), oldest first
+        self.resetStats()
+
+    def clear(self):
+        self.entries.clear()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.evictions = 0
+
+    # ? (moves, status) stored for key or None, a hit becomes the most recently used entry
+    # * moves is the cached array itself, callers get a copy from GameState.getLegalMoves
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, moves, status):
+        entries = self.entries
+        entries[key] = (array('H', moves), status)
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def getStats(self):
+        return {"size": self.size, "entries": len(self.entries), "probes": self.probes, "hits": self.hits,
+                "hitRate": round(self.hits / max(1, self.probes), 4), "evictions": self.evictions}
@@ -0,0 +1,129 @@
+
+# ? batch evaluation with numpy: many positions scored at once with the chessEval tables
+# ? a position is a row of 64 int8 piece codes (ChessEngine.PIECE_CODES), N positions an (N, 64) array,
+# ? the scores are gathered from (13, 64) tables and summed per row, no python loop per position or square
+# * numpy is optional, without it AVAILABLE is False and the engine never calls in here
+# * python chessNumpyEval.py positions.fen
+
+import argparse
+import sys
+import time
+import chessEval
+from ChessEngine import (PIECE_CODES, PIECE_CODE_INDEX, PROMOTION_PIECES, MOVE_CASTLE, MOVE_ENPASSANT,
+                         MOVE_PROMOTION)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+if AVAILABLE:
+    # * row 0 is the empty square and scores nothing
+    MG_TABLE = np.array([[0] * 64] + [chessEval.PST_MG[piece] for piece in PIECE_CODES[1:]], dtype=np.int32)
+    EG_TABLE = np.array([[0] * 64] + [chessEval.PST_EG[piece] for piece in PIECE_CODES[1:]], dtype=np.int32)
+    PHASE_TABLE = np.array([0] + [chessEval.PHASE[piece] for piece in PIECE_CODES[1:]], dtype=np.int32)
+    SQUARES = np.arange(64)
+
+
+def requireNumpy():
+    if not AVAILABLE:
+        raise ImportError("chessNumpyEval needs numpy: pip install numpy")
+
+
+# ? the 64 piece codes of a GameState.board, into out (a row of a batch) when given
+def encodeBoard(board, out=None):
+    requireNumpy()
+    if out is None:
+        out = np.empty(64, dtype=np.int8)
+    out[:] = [PIECE_CODE_INDEX[piece] for row in board for piece in row]
+    return out
+
+
+# ? the codes after a packed move, patched from the codes before it instead of reading the board again
+def encodeMove(codes, move, out):
+    out[:] = codes
+    startSq = move & 63
+    endSq = (move >> 6) & 63
+    flag = move >> 12
+    piece = int(codes[startSq])
+    if flag >= MOVE_PROMOTION:
+        piece = PIECE_CODE_INDEX[PIECE_CODES[piece][0] + PROMOTION_PIECES[flag - MOVE_PROMOTION]]
+    out[startSq] = 0
+    out[endSq] = piece
+    if flag == MOVE_ENPASSANT:
+        out[(startSq & ~7) | (endSq & 7)] = 0
+    elif flag == MOVE_CASTLE:
+        rookFrom, rookTo = (endSq + 1, endSq - 1) if endSq > startSq else (endSq - 2, endSq + 1)
+        out[rookTo] = out[rookFrom]
+        out[rookFrom] = 0
+    return out
+
+
+# ? (N, 64) codes -> (N,) tapered scores in centipawns from white's point of view, same as scoreMaterial
+def evaluateBatch(codes):
+    requireNumpy()
+    codes = np.asarray(codes, dtype=np.intp)
+    mgScores = MG_TABLE[codes, SQUARES].sum(axis=1)
+    egScores = EG_TABLE[codes, SQUARES].sum(axis=1)
+    phases = np.minimum(PHASE_TABLE[codes].sum(axis=1), chessEval.MAX_PHASE)
+    return (mgScores * phases + egScores * (chessEval.MAX_PHASE - phases)) // chessEval.MAX_PHASE
+
+
+# ? scores of many boards at once
+def evaluateBoards(boards):
+    requireNumpy()
+    codes = np.empty((len(boards), 64), dtype=np.int8)
+    for i, board in enumerate(boards):
+        encodeBoard(board, codes[i])
+    return evaluateBatch(codes)
+
+
+# ? root moves sorted by the static score after each of them, best for the side to move first
+def orderRootMoves(gs, moves):
+    requireNumpy()
+    if len(moves) < 2:
+        return list(moves)
+    root = encodeBoard(gs.board)
+    codes = np.empty((len(moves), 64), dtype=np.int8)
+    for i, move in enumerate(moves):
+        encodeMove(root, move, codes[i])
+    scores = evaluateBatch(codes) * (1 if gs.whiteToMove else -1)
+    order = np.argsort(-scores, kind="stable")
+    return [moves[i] for i in order]
+
+
+def main(argv=None):
+    import ChessEngine
+    import chessAI
+    requireNumpy()
+    parser = argparse.ArgumentParser(description="score FEN positions with the batch evaluator")
+    parser.add_argument("input", help="FEN file, one position per line, - for stdin")
+    args = parser.parse_args(argv)
+    inputFile = sys.stdin if args.input == "-" else open(args.input)
+    fens = [line.split(";")[0].strip() for line in inputFile if line.strip() and not line.startswith("#")]
+    boards = [ChessEngine.GameState.fromFen(fen).board for fen in fens]
+
+    startTime = time.perf_counter()
+    codes = np.empty((len(boards), 64), dtype=np.int8)
+    for i, board in enumerate(boards):
+        encodeBoard(board, codes[i])
+    encodeTime = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    scores = evaluateBatch(codes)
+    batchTime = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    expected = [chessAI.scoreMaterial(board) for board in boards]
+    loopTime = time.perf_counter() - startTime
+    for fen, score in zip(fens, scores):
+        print(str(int(score)) + " " + fen)
+    print("positions " + str(len(boards)) + " encode " + str(round(encodeTime, 4)) + "s batch " +
+          str(round(batchTime, 4)) + "s loop " +
+          str(round(loopTime, 4)) + "s mismatches " + str(sum(int(a) != b for a, b in zip(scores, expected))),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+
+# ? PGN reading: split a stream into games and turn SAN moves into packed moves of a GameState
+# * only the main line is kept, comments, variations and NAGs are skipped
+
+import re
+from ChessEngine import MOVE_CASTLE, MOVE_PROMOTION, PROMOTION_PIECES, START_FEN, getPackedNotation
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+
+# ? the packed move that san stands for in gs, raises ValueError if it is not a legal move
+def parseSan(gs, san):
+    token = san.rstrip("+#!?")
+    legalMoves = gs.getLegalMoves()
+    if token in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingSide = len(token) == 3
+        for move in legalMoves:
+            if move >> 12 == MOVE_CASTLE and (((move >> 6) & 7) == 6) == kingSide:
+                return move
+        raise ValueError("illegal castling: " + san)
+    match = _SAN.match(token)
+    if match is None:
+        # * long algebraic (e2e4, e7e8q) turns up in some files as well
+        for move in legalMoves:
+            if getPackedNotation(move) == token.lower():
+                return move
+        raise ValueError("cannot read move: " + san)
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    piece = piece or "P"
+    endSq = (8 - int(target[1])) * 8 + "abcdefgh".index(target[0])
+    found = []
+    for move in legalMoves:
+        startSq = move & 63
+        if (move >> 6) & 63 != endSq or gs.board[startSq >> 3][startSq & 7][1] != piece:
+            continue
+        if fromFile is not None and "abcdefgh"[startSq & 7] != fromFile:
+            continue
+        if fromRank is not None and str(8 - (startSq >> 3)) != fromRank:
+            continue
+        flag = move >> 12
+        if flag >= MOVE_PROMOTION:
+            if PROMOTION_PIECES[flag - MOVE_PROMOTION] != (promotion or "Q"):
+                continue
+        elif promotion is not None:
+            continue
+        found.append(move)
+    if len(found) != 1:
+        raise ValueError(("ambiguous move: " if found else "illegal move: ") + san)
+    return found[0]
+
+
+# ? SAN of a legal packed move in gs, e.g. Nbd7, exd6, e8=Q+, O-O
+def toSan(gs, move):
+    startSq = move & 63
+    endSq = (move >> 6) & 63
+    flag = move >> 12
+    piece = gs.board[startSq >> 3][startSq & 7][1]
+    target = getPackedNotation(move)[2:4]
+    if flag == MOVE_CASTLE:
+        san = "O-O" if (endSq & 7) == 6 else "O-O-O"
+    else:
+        isCapture = gs.board[endSq >> 3][endSq & 7] != "--" or (piece == "P" and (startSq & 7) != (endSq & 7))
+        if piece == "P":
+            san = ("abcdefgh"[startSq & 7] + "x" if isCapture else "") + target
+            if flag >= MOVE_PROMOTION:
+                san += "=" + PROMOTION_PIECES[flag - MOVE_PROMOTION]
+        else:
+            # * name the file, then the rank, then both, when another piece of the same type can go there too
+            others = [other & 63 for other in gs.getLegalMoves() if other != move and (other >> 6) & 63 == endSq and
+                      gs.board[(other >> 3) & 7][other & 7][1] == piece]
+            disambiguation = ""
+            if others:
+                if all((sq & 7) != (startSq & 7) for sq in others):
+                    disambiguation = "abcdefgh"[startSq & 7]
+                elif all((sq >> 3) != (startSq >> 3) for sq in others):
+                    disambiguation = str(8 - (startSq >> 3))
+                else:
+                    disambiguation = "abcdefgh"[startSq & 7] + str(8 - (startSq >> 3))
+            san = piece + disambiguation + ("x" if isCapture else "") + target
+    gs.makePackedMove(move)
+    replies = gs.getLegalMoves()
+    if gs.inCheck:
+        san += "#" if len(replies) == 0 else "+"
+    gs.undoMove()
+    return san
+
+
+# ? split the movetext of a game into SAN tokens, dropping move numbers, comments, variations and NAGs
+def sanTokens(movetext):
+    tokens = []
+    depth = 0  # * variation nesting
+    movetext = re.sub(r"\{[^}]*\}|;[^\n]*", " ", movetext)
+    for token in movetext.replace("(", " ( ").replace(")", " ) ").split():
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth > 0 or token.startswith("$") or token in RESULTS:
+            continue
+        else:
+            token = re.sub(r"^\d+\.+", "", token)
+            if token:
+                tokens.append(token)
+    return tokens
+
+
+# ? yield (headers, san moves) for every game in an iterable of lines, one game in memory at a time
+def readGames(lines):
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("[") and _HEADER.match(line):
+            if movetext:
+                yield headers, sanTokens(" ".join(movetext))
+                headers = {}
+                movetext = []
+            key, value = _HEADER.match(line).groups()
+            headers[key] = value
+        elif line and not line.startswith("%"):
+            movetext.append(line)
+            if line.split()[-1] in RESULTS:
+                yield headers, sanTokens(" ".join(movetext))
+                headers = {}
+                movetext = []
+    if movetext or headers:
+        yield headers, sanTokens(" ".join(movetext))
+
+
+# ? play a game from readGames on a fresh gameClass, calling visit(gs, ply) before every move and after the last
+# * stops with ValueError at the first move that cannot be read
+def replayGame(gameClass, headers, sanMoves, visit=None):
+    gs = gameClass.fromFen(headers.get("FEN", START_FEN))
+    for ply, san in enumerate(sanMoves):
+        if visit is not None:
+            visit(gs, ply)
+        gs.makePackedMove(parseSan(gs, san))
+    if visit is not None:
+        visit(gs, len(sanMoves))
+    return gs
@@ -0,0 +1,193 @@
+
+# ? root split parallel search: the root moves of every iteration are handed out to a pool of worker processes
+# ? every worker searches its root moves with its own chessAI.Searcher and transposition table,
+# ? the main process collects the scores, orders the moves for the next depth and keeps the last complete depth
+# ? the first (best so far) move of each depth is searched alone with a full window, the rest then only
+# ? have to prove they beat it, like young brothers wait at the root
+# * processes instead of threads because the GIL would run the python search on one core
+# * with workers=1 no pool is started and chessAI.Searcher.think runs in this process, so the result is deterministic
+
+import multiprocessing
+import os
+import time
+import chessAI
+import ChessEngine
+from chessAI import CHECKMATE, MAX_PLY, SearchResult, SearchStopped
+
+WORKERS = os.cpu_count() or 1
+WORKER_TT_SIZE_MB = 16  # * per worker process
+
+# * state of a worker process, set up once by initWorker
+_worker = {}
+
+
+def initWorker(ttSizeMB, stopFlag):
+    _worker["searcher"] = chessAI.Searcher(chessAI.chessTT.TranspositionTable(ttSizeMB))
+    _worker["searcher"].shouldStop = lambda: stopFlag.value != 0
+    _worker["searchID"] = None
+    _worker["position"] = None
+
+
+# ? search one root move to depth - 1 in a worker, returns (move, score, pv, nodes) or (move, None, [], nodes) if stopped
+# * a score <= alpha is only an upper bound, anything above it is exact since beta is unbounded
+# * deadline is wall clock time (time.time) since perf_counter is not shared between processes
+# * the root comes as the starting FEN plus the moves played since, so repetitions of the game are seen
+def searchRootMove(searchID, startFen, moves, gameClass, move, depth, alpha, deadline, nodeLimit):
+    searcher = _worker["searcher"]
+    if _worker["searchID"] != searchID:
+        # * new search: age the transposition table and forget the killers and history of the last one
+        _worker["searchID"] = searchID
+        searcher.tt.newSearch()
+        searcher.killers = [[0, 0] for _ in range(MAX_PLY)]
+        searcher.history = [0] * 4096
+    if _worker["position"] != (startFen, moves) or type(_worker["gs"]) is not gameClass:
+        _worker["gs"] = gameClass.fromFen(startFen)
+        for played in moves:
+            _worker["gs"].makePackedMove(played)
+        _worker["position"] = (startFen, moves)
+    gs = _worker["gs"]
+    rootPly = len(gs.movelog)
+    searcher.nodes = 0
+    searcher.deadline = time.perf_counter() + (deadline - time.time()) if deadline is not None else None
+    searcher.nodeLimit = nodeLimit
+    gs.makePackedMove(move)
+    try:
+        score = -searcher.negaMax(gs, depth - 1, -CHECKMATE - 1, -alpha, 1)
+        pv = [move] + searcher.pvTable[1]
+    except SearchStopped:
+        score = None
+        pv = []
+        while len(gs.movelog) > rootPly + 1:
+            gs.undoMove()
+    gs.undoMove()
+    return move, score, pv, searcher.nodes
+
+
+class ParallelSearcher():
+    def __init__(self, workers=WORKERS, ttSizeMB=WORKER_TT_SIZE_MB):
+        self.workers = max(1, workers)
+        self.ttSizeMB = ttSizeMB
+        self.pool = None
+        self.searcher = None
+        self.searchID = 0
+        self.nodes = 0
+        self.shouldStop = None  # * optional function, the search stops when it returns True
+        self.onIteration = None  # * optional function, called with the SearchResult of every finished depth
+        if self.workers == 1:
+            self.searcher = chessAI.Searcher(chessAI.chessTT.TranspositionTable(ttSizeMB))
+        else:
+            # * raised to stop every worker at once
+            self.stopFlag = multiprocessing.Value('i', 0)
+            self.pool = multiprocessing.Pool(self.workers, initializer=initWorker, initargs=(ttSizeMB, self.stopFlag))
+
+    # ? the transposition table of every worker starts empty again
+    def clear(self):
+        if self.searcher is not None:
+            self.searcher.tt.clear()
+        else:
+            self.close()
+            self.pool = multiprocessing.Pool(self.workers, initializer=initWorker,
+                                             initargs=(self.ttSizeMB, self.stopFlag))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ? same arguments and result as chessAI.Searcher.think
+    # * iterative deepening on the main process, each depth is one round of root moves over the pool
+    def think(self, gs, maxDepth=MAX_PLY - 1, timeLimit=None, nodeLimit=None, validMoves=None):
+        if self.searcher is not None:
+            self.searcher.shouldStop = self.shouldStop
+            self.searcher.onIteration = self.onIteration
+            return self.searcher.think(gs, maxDepth, timeLimit, nodeLimit, validMoves)
+
+        self.stopFlag.value = 0
+        startTime = time.time()
+        deadline = startTime + timeLimit if timeLimit is not None else None
+        self.searchID += 1
+        self.nodes = 0
+        if validMoves is None:
+            rootMoves = list(gs.getLegalMoves())
+        else:
+            rootMoves = [move.packed for move in validMoves]
+        startFen = gs.startFen
+        moves = tuple(gs.movelog)
+        gameClass = type(gs)
+
+        result = chessAI.tablebaseResult(gs, rootMoves)
+        if result is not None:
+            result.elapsed = time.time() - startTime
+            if self.onIteration is not None:
+                self.onIteration(result)
+            return result
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, 0, rootMoves[:1], 0)
+        for depth in range(1, min(maxDepth, MAX_PLY - 1) + 1):
+            if len(rootMoves) == 0:
+                break
+            scores = {}
+            pvs = {}
+            alpha = -CHECKMATE - 1
+            stopped = False
+            for batch in (rootMoves[:1], rootMoves[1:]):
+                # * the budget left is shared out between the moves of the batch, not given to each of them
+                budget = max(0, nodeLimit - self.nodes) // max(1, len(batch)) if nodeLimit is not None else None
+                tasks = [self.pool.apply_async(searchRootMove, (self.searchID, startFen, moves, gameClass, move,
+                                                                depth, alpha, deadline, budget)) for move in batch]
+                for task in tasks:
+                    while not task.ready():
+                        task.wait(0.01)
+                        if self.shouldStop is not None and self.shouldStop():
+                            self.stopFlag.value = 1
+                    move, score, pv, nodes = task.get()
+                    self.nodes += nodes
+                    if score is None:
+                        stopped = True
+                    else:
+                        scores[move] = score
+                        pvs[move] = pv
+                if stopped:
+                    break
+                alpha = scores[rootMoves[0]]
+            if stopped:
+                break
+            # * best first for the next depth, ties keep the old order so the result does not depend on timing
+            rootMoves.sort(key=lambda move: -scores[move])
+            best = rootMoves[0]
+            result = SearchResult(best, scores[best], depth, pvs[best], self.nodes, time.time() - startTime)
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if len(rootMoves) <= 1 or abs(scores[best]) > CHECKMATE - MAX_PLY:
+                break  # * forced move or a forced mate, deeper search changes nothing
+            if deadline is not None and time.time() - startTime > timeLimit / 2:
+                break
+            if nodeLimit is not None and self.nodes >= nodeLimit:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.time() - startTime
+        return result
+
+
+# ? parallel version of chessAI.findBestMoveNegaMax, returns the matching Move from validMoves
+def findBestMoveParallel(gs, validMoves, workers=WORKERS, depth=MAX_PLY - 1, timeLimit=chessAI.TIME_LIMIT, nodeLimit=None):
+    with ParallelSearcher(workers) as searcher:
+        result = searcher.think(gs, depth, timeLimit, nodeLimit, validMoves)
+    for move in validMoves:
+        if move.packed == result.move:
+            return move
+    return None
+
+
+if __name__ == "__main__":
+    # * quick scaling check: nodes per second of the start position for 1 worker and for all of them
+    for count in sorted({1, WORKERS}):
+        with ParallelSearcher(count) as searcher:
+            found = searcher.think(ChessEngine.GameState(), timeLimit=5.0)
+        print(str(count) + " workers: " + str(found) + " nps " + str(int(found.nodes / max(found.elapsed, 1e-9))))
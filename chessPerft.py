@@ -0,0 +1,147 @@
+
+# ? perft: count the leaf nodes of the legal move tree to a fixed depth and compare with known counts
+# ? divide prints the count under every root move, so a wrong total can be chased down move by move
+# ? bench runs the whole suite and writes the timings to JSON, to compare engine versions
+# * python chessPerft.py perft 4 [--position kiwipete | --fen "..."] [--bitboard]
+# * python chessPerft.py divide 3 --position kiwipete
+# * python chessPerft.py bench --depth 3 --out perft.json [--compare old.json] [--bitboard]
+
+import argparse
+import json
+import platform
+import sys
+import time
+import ChessEngine
+import chessBitboard
+from ChessEngine import getPackedNotation
+
+# * name: (fen, node counts for depth 1, 2, 3 ...), from the chessprogramming wiki perft results
+POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 (48, 2039, 97862, 4085603)),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  (14, 191, 2812, 43238, 674624)),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  (6, 264, 9467, 422333)),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  (44, 1486, 62379, 2103487)),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  (46, 2079, 89890, 3894594)),
+}
+
+GAME_STATES = {"board": ChessEngine.GameState, "bitboard": chessBitboard.BitboardGameState}
+
+
+def perft(gs, depth):
+    moves = gs.getLegalMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1  # * bulk count the last ply
+    nodes = 0
+    for move in moves:
+        gs.makePackedMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+# ? perft split by root move, returns [(notation, nodes)]
+def divide(gs, depth):
+    counts = []
+    for move in gs.getLegalMoves():
+        gs.makePackedMove(move)
+        counts.append((getPackedNotation(move), perft(gs, depth - 1)))
+        gs.undoMove()
+    return counts
+
+
+def timedPerft(gs, depth):
+    start = time.perf_counter()
+    nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, int(nodes / elapsed) if elapsed > 0 else 0
+
+
+# ? run every standard position up to depth and return the results, ok is False on a wrong count
+def runSuite(depth, states=GAME_STATES, positions=POSITIONS, out=sys.stdout):
+    results = []
+    for stateName, cls in states.items():
+        for name, (fen, expected) in positions.items():
+            positionDepth = min(depth, len(expected))
+            gs = cls.fromFen(fen)
+            gs.moveCache = None  # * time the move generator itself, not the cache
+            nodes, elapsed, nps = timedPerft(gs, positionDepth)
+            ok = nodes == expected[positionDepth - 1]
+            results.append({"state": stateName, "position": name, "depth": positionDepth, "nodes": nodes,
+                            "expected": expected[positionDepth - 1], "ok": ok,
+                            "seconds": round(elapsed, 4), "nps": nps})
+            if out is not None:
+                print("%-8s %-10s depth %d nodes %9d %s %8.3fs %8d nps" % (
+                    stateName, name, positionDepth, nodes, "ok  " if ok else "FAIL", elapsed, nps), file=out)
+    return results
+
+
+# * nps of this run against an older bench file, per state and position
+def compareResults(results, baseline):
+    old = {(r["state"], r["position"], r["depth"]): r for r in baseline["results"]}
+    for r in results:
+        before = old.get((r["state"], r["position"], r["depth"]))
+        if before is not None and before["nps"] > 0:
+            print("%-8s %-10s %8d -> %8d nps (%+.1f%%)" % (
+                r["state"], r["position"], before["nps"], r["nps"], 100.0 * (r["nps"] - before["nps"]) / before["nps"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="perft and move generation benchmark")
+    parser.add_argument("command", choices=("perft", "divide", "bench"))
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--depth", dest="benchDepth", type=int, default=None)
+    parser.add_argument("--position", default="start", choices=sorted(POSITIONS))
+    parser.add_argument("--fen", default=None)
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState (bench: only it)")
+    parser.add_argument("--out", default=None, help="bench: write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="bench: JSON file of an earlier run")
+    args = parser.parse_args(argv)
+    depth = args.benchDepth if args.benchDepth is not None else args.depth
+
+    if args.command == "bench":
+        # * both classes by default, so their timings can be compared; --bitboard runs that one alone
+        states = {"bitboard": GAME_STATES["bitboard"]} if args.bitboard else GAME_STATES
+        results = runSuite(depth, states)
+        report = {"depth": depth, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "python": platform.python_version(), "results": results,
+                  "totalNodes": sum(r["nodes"] for r in results),
+                  "totalSeconds": round(sum(r["seconds"] for r in results), 4)}
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                compareResults(results, json.load(f))
+        return 0 if all(r["ok"] for r in results) else 1
+
+    fen = args.fen if args.fen else POSITIONS[args.position][0]
+    gs = GAME_STATES["bitboard" if args.bitboard else "board"].fromFen(fen)
+    gs.moveCache = None
+    if args.command == "divide":
+        start = time.perf_counter()
+        counts = divide(gs, depth)
+        elapsed = time.perf_counter() - start
+        for notation, nodes in counts:
+            print(notation + ": " + str(nodes))
+        total = sum(nodes for _, nodes in counts)
+        print("\nmoves " + str(len(counts)) + " nodes " + str(total) + " time " + str(round(elapsed, 3)))
+        return 0
+    nodes, elapsed, nps = timedPerft(gs, depth)
+    print("nodes " + str(nodes) + " time " + str(round(elapsed, 3)) + " nps " + str(nps))
+    if args.fen is None:
+        expected = POSITIONS[args.position][1]
+        if depth <= len(expected) and nodes != expected[depth - 1]:
+            print("expected " + str(expected[depth - 1]))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
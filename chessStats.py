@@ -0,0 +1,223 @@
+
+# ? search instrumentation: counts and times what a search spends its effort on, for picking optimisations
+# ? a SearchStats handed to a Searcher wraps the game state and searcher methods for the length of one search,
+# ? without one nothing is wrapped so the search runs exactly as before
+# * times are inclusive: quiescence time contains the move generation and evaluation done inside it
+# * python chessStats.py --fen "..." --depth 4 [--profile] [--out stats.jsonl]
+
+import argparse
+import cProfile
+import inspect
+import io
+import json
+import pstats
+import sys
+import time
+
+CUTOFF_SLOTS = 8  # * cutoffs by index of the move that caused them, the last slot counts every later move
+# * wrapped method name -> phase its time counts to
+GAME_STATE_METHODS = {"getLegalMoves": "moveGeneration", "getValidMoves": "moveGeneration",
+                      "getLegalityContext": "moveGeneration", "getPseudoMoves": "moveGeneration",
+                      "isPseudoMove": "moveGeneration", "isLegalMove": "moveGeneration",
+                      "squareUnderAttack": "attackChecks", "isSquareAttacked": "attackChecks",
+                      "isAttackedWith": "attackChecks",
+                      "getEvaluation": "evaluation", "makePackedMove": "makeUndo", "undoMove": "makeUndo"}
+# * pickMoves is a generator, its time is what each step takes, not the searching done between steps
+SEARCHER_METHODS = {"quiescence": "quiescence", "orderMoves": "ordering", "pickMoves": "ordering"}
+
+
+class SearchStats():
+    def __init__(self):
+        self.reset()
+        self.wrapped = []  # * (object, method name) wrapped by the running search
+
+    def reset(self):
+        self.nodes = 0
+        self.depth = 0
+        self.calls = {name: 0 for name in list(GAME_STATE_METHODS) + list(SEARCHER_METHODS)}
+        self.phaseTime = {phase: 0.0 for phase in set(GAME_STATE_METHODS.values()) | set(SEARCHER_METHODS.values())}
+        self.legalMovesGenerated = 0
+        self.cutoffs = [0] * CUTOFF_SLOTS
+        self.events = {}  # * pruning and reduction counts, by name
+        self.iterationNodes = []  # * nodes when every iteration finished, for the effective branching factor
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.moveCacheProbes = 0
+        self.moveCacheHits = 0
+        self.elapsed = 0.0
+        self.running = {}  # * phase -> wrapped calls in progress, so nested calls are timed once
+        self.startTime = None
+        self.ttBefore = (0, 0)
+        self.moveCache = None
+        self.moveCacheBefore = (0, 0)
+
+    # ? called by Searcher.think when the search starts: reset the counters and wrap the methods
+    def begin(self, searcher, gs):
+        self.reset()
+        self.startTime = time.perf_counter()
+        self.ttBefore = (searcher.tt.probes, searcher.tt.hits)
+        self.moveCache = gs.moveCache
+        if self.moveCache is not None:
+            self.moveCacheBefore = (self.moveCache.probes, self.moveCache.hits)
+        for name, phase in GAME_STATE_METHODS.items():
+            self.wrap(gs, name, phase)
+        for name, phase in SEARCHER_METHODS.items():
+            self.wrap(searcher, name, phase)
+
+    # ? called when the search is over: unwrap and take the totals
+    # * result is None when the search raised
+    def end(self, searcher, result):
+        for owner, name in self.wrapped:
+            del owner.__dict__[name]  # * the class method shows through again
+        self.wrapped = []
+        self.elapsed = time.perf_counter() - self.startTime
+        self.nodes = searcher.nodes
+        self.depth = result.depth if result is not None else 0
+        self.ttProbes = searcher.tt.probes - self.ttBefore[0]
+        self.ttHits = searcher.tt.hits - self.ttBefore[1]
+        if self.moveCache is not None:
+            self.moveCacheProbes = self.moveCache.probes - self.moveCacheBefore[0]
+            self.moveCacheHits = self.moveCache.hits - self.moveCacheBefore[1]
+
+    # * shadow the method with a counting and timing version on the instance itself
+    def wrap(self, owner, name, phase):
+        if name in owner.__dict__ or not hasattr(owner, name):
+            return  # * already wrapped, or a method only BitboardGameState has
+        method = getattr(owner, name)
+        calls = self.calls
+        phaseTime = self.phaseTime
+        running = self.running
+        running[phase] = 0
+        counted = name in ("getLegalMoves",)
+        clock = time.perf_counter
+
+        # * keyed by phase: squareUnderAttack calls isSquareAttacked, getValidMoves calls getLegalMoves,
+        # * the inner call is already inside the outer one's time
+        def wrapper(*args):
+            calls[name] += 1
+            if running[phase]:
+                value = method(*args)
+            else:
+                running[phase] += 1
+                start = clock()
+                try:
+                    value = method(*args)
+                finally:
+                    running[phase] -= 1
+                    phaseTime[phase] += clock() - start
+            if counted:
+                self.legalMovesGenerated += len(value)
+            return value
+
+        def generatorWrapper(*args):
+            calls[name] += 1
+            moves = method(*args)
+            while True:
+                timed = not running[phase]
+                running[phase] += 1
+                start = clock()
+                try:
+                    move = next(moves, None)
+                finally:
+                    running[phase] -= 1
+                    if timed:
+                        phaseTime[phase] += clock() - start
+                if move is None:
+                    return
+                yield move
+        owner.__dict__[name] = generatorWrapper if inspect.isgeneratorfunction(method) else wrapper
+        self.wrapped.append((owner, name))
+
+    def cutoffAt(self, index):
+        self.cutoffs[min(index, CUTOFF_SLOTS - 1)] += 1
+
+    def count(self, event):
+        self.events[event] = self.events.get(event, 0) + 1
+
+    def iteration(self, nodes):
+        self.iterationNodes.append(nodes)
+
+    def toDict(self):
+        totalCutoffs = sum(self.cutoffs)
+        quiescenceNodes = self.calls["quiescence"]
+        generated = self.calls["getLegalMoves"]
+        branching = [round(self.iterationNodes[i] / max(1, self.iterationNodes[i - 1]), 2)
+                     for i in range(1, len(self.iterationNodes))]
+        return {"depth": self.depth, "nodes": self.nodes, "quiescenceNodes": quiescenceNodes,
+                "mainNodes": self.nodes - quiescenceNodes, "seconds": round(self.elapsed, 4),
+                "nodesPerSecond": int(self.nodes / max(self.elapsed, 1e-9)), "calls": dict(self.calls),
+                "averageLegalMoves": round(self.legalMovesGenerated / max(1, generated), 2),
+                "ttProbes": self.ttProbes, "ttHits": self.ttHits,
+                "ttHitRate": round(self.ttHits / max(1, self.ttProbes), 4),
+                "moveCacheProbes": self.moveCacheProbes, "moveCacheHits": self.moveCacheHits,
+                "cutoffs": totalCutoffs, "cutoffsByMoveIndex": list(self.cutoffs),
+                "firstMoveCutoffRate": round(self.cutoffs[0] / max(1, totalCutoffs), 4),
+                "effectiveBranchingFactor": branching, "events": dict(self.events),
+                "phaseSeconds": {phase: round(seconds, 4) for phase, seconds in sorted(self.phaseTime.items())}}
+
+    def toJson(self):
+        return json.dumps(self.toDict())
+
+
+# ? run searcher.think under cProfile, write the report sorted by sortBy and return the search result
+def profileSearch(searcher, gs, maxDepth, timeLimit=None, nodeLimit=None, sortBy="cumulative", limit=30,
+                  out=sys.stdout, path=None):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = searcher.think(gs, maxDepth, timeLimit, nodeLimit)
+    finally:
+        profiler.disable()
+    if path is not None:
+        profiler.dump_stats(path)  # * for snakeviz or pstats later
+    if out is not None:
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats(sortBy).print_stats(limit)
+        out.write(report.getvalue())
+    return result
+
+
+def main(argv=None):
+    import ChessEngine
+    import chessAI
+    import chessBitboard
+    parser = argparse.ArgumentParser(description="search a position and report where the time goes")
+    parser.add_argument("--fen", default=ChessEngine.START_FEN)
+    parser.add_argument("--depth", type=int, default=chessAI.DEPTH + 1)
+    parser.add_argument("--time", type=float, default=None)
+    parser.add_argument("--nodes", type=int, default=None)
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState")
+    parser.add_argument("--out", default=None, help="append the stats as a JSON line")
+    parser.add_argument("--no-null-move", action="store_true")
+    parser.add_argument("--no-lmr", action="store_true")
+    parser.add_argument("--no-futility", action="store_true", help="also switches off reverse futility")
+    parser.add_argument("--no-check-extensions", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile and print the report")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key")
+    parser.add_argument("--limit", type=int, default=30, help="functions in the report")
+    parser.add_argument("--profile-out", default=None, help="write the raw cProfile data here")
+    args = parser.parse_args(argv)
+
+    gameClass = chessBitboard.BitboardGameState if args.bitboard else ChessEngine.GameState
+    gs = gameClass.fromFen(args.fen)
+    stats = SearchStats()
+    searcher = chessAI.Searcher(stats=stats)
+    searcher.useNullMove = not args.no_null_move
+    searcher.useLMR = not args.no_lmr
+    searcher.useFutility = searcher.useReverseFutility = not args.no_futility
+    searcher.useCheckExtensions = not args.no_check_extensions
+    if args.profile:
+        result = profileSearch(searcher, gs, args.depth, args.time, args.nodes, args.sort, args.limit,
+                               sys.stdout, args.profile_out)
+    else:
+        result = searcher.think(gs, args.depth, args.time, args.nodes)
+    print(result)
+    print(json.dumps(stats.toDict(), indent=2))
+    if args.out:
+        with open(args.out, "a") as f:
+            f.write(stats.toJson() + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+
+# ? fixed size transposition table for the chessAI search
+# ? entries are keyed by GameState.zobristKey and live in two flat arrays, so memory stays bounded
+# ? every bucket holds two entries: a depth-preferred slot and an always-replace slot
+
+from array import array
+
+EXACT = 0
+LOWER = 1  # * score is at least this much (fail high)
+UPPER = 2  # * score is at most this much (fail low)
+
+ENTRY_BYTES = 16  # * one 64 bit key plus one 64 bit packed data word
+SCORE_OFFSET = 1 << 31
+
+# * data word layout: score (32 bits) | move (16 bits) | depth (8 bits) | bound (2 bits) | generation (6 bits)
+MOVE_SHIFT = 32
+DEPTH_SHIFT = 48
+BOUND_SHIFT = 56
+GENERATION_SHIFT = 58
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        # * round the bucket count down to a power of two so a bucket is found with a mask
+        buckets = max(1, (sizeMB * 1024 * 1024) // (2 * ENTRY_BYTES))
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self.sizeMB = sizeMB
+        self.mask = self.buckets - 1
+        self.keys = array('Q', bytes(16 * self.buckets))
+        self.data = array('Q', bytes(16 * self.buckets))
+        self.generation = 0
+        self.resetStats()
+
+    def clear(self):
+        self.resize(self.sizeMB)
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # * bucket was in use by other positions
+        self.stores = 0
+        self.overwrites = 0  # * a store evicted a different position
+
+    # ? call once per search so entries from older searches are replaced first
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 63
+
+    # ? returns (depth, score, bound, move) or None, move is the stored move id (0 if none)
+    def probe(self, key):
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] == key:
+            entry = self.data[slot]
+        elif keys[slot + 1] == key:
+            entry = self.data[slot + 1]
+        else:
+            self.misses += 1
+            if keys[slot] or keys[slot + 1]:
+                self.collisions += 1
+            return None
+        self.hits += 1
+        return ((entry >> DEPTH_SHIFT) & 0xFF, (entry & 0xFFFFFFFF) - SCORE_OFFSET,
+                (entry >> BOUND_SHIFT) & 3, (entry >> MOVE_SHIFT) & 0xFFFF)
+
+    def store(self, key, depth, score, bound, move=0):
+        self.stores += 1
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        data = self.data
+        entry = (score + SCORE_OFFSET) | move << MOVE_SHIFT | depth << DEPTH_SHIFT | \
+            bound << BOUND_SHIFT | self.generation << GENERATION_SHIFT
+        old = data[slot]
+        # * the depth-preferred slot keeps the deepest result of the current search,
+        # * anything else goes to the always-replace slot
+        if keys[slot] == key or keys[slot] == 0 or depth >= (old >> DEPTH_SHIFT) & 0xFF or \
+                (old >> GENERATION_SHIFT) != self.generation:
+            if keys[slot] == key:
+                if move == 0:  # * keep the old best move if we have none
+                    entry |= old & (0xFFFF << MOVE_SHIFT)
+            else:
+                if keys[slot + 1] == key:
+                    if move == 0:
+                        entry |= data[slot + 1] & (0xFFFF << MOVE_SHIFT)
+                    keys[slot + 1] = 0
+                    data[slot + 1] = 0
+                if keys[slot] != 0:
+                    # * the replaced entry moves down to the always-replace slot
+                    if keys[slot + 1] != 0:
+                        self.overwrites += 1
+                    keys[slot + 1] = keys[slot]
+                    data[slot + 1] = old
+            keys[slot] = key
+            data[slot] = entry
+        else:
+            if keys[slot + 1] == key:
+                if move == 0:
+                    entry |= data[slot + 1] & (0xFFFF << MOVE_SHIFT)
+            elif keys[slot + 1] != 0:
+                self.overwrites += 1
+            keys[slot + 1] = key
+            data[slot + 1] = entry
+
+    # ? permille of the table in use (sampled from the first 1000 entries, like UCI hashfull)
+    def hashfull(self):
+        sample = min(1000, 2 * self.buckets)
+        used = sum(1 for i in range(sample) if self.keys[i] and
+                   (self.data[i] >> GENERATION_SHIFT) == self.generation)
+        return used * 1000 // sample
+
+    def getStats(self):
+        return {"sizeMB": self.sizeMB, "entries": 2 * self.buckets, "probes": self.probes,
+                "hits": self.hits, "misses": self.misses, "collisions": self.collisions,
+                "stores": self.stores, "overwrites": self.overwrites}
@@ -0,0 +1,506 @@
+
+# ? endgame tablebases: distance to mate for every position of a small material signature (KQK, KRK, KPK, KQKR ...)
+# ? generated by retrograde analysis and stored one byte per position, probed through mmap so a lookup is O(1)
+# * byte value: 0 draw, 255 illegal position, otherwise 1 + plies to mate, odd plies win for the side to move
+# * python chessTablebase.py generate KQK KRK KPK [--dir tablebases]
+# * python chessTablebase.py probe --fen "8/8/8/8/8/2k5/8/KQ6 w - - 0 1"
+# * python chessTablebase.py verify KQKR [--samples 1000] [--depth 2]
+
+import argparse
+import mmap
+import os
+import sys
+import time
+import chessBitboard
+from chessBitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rookAttacks, bishopAttacks
+from ChessEngine import getPackedNotation
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAX_PIECES = 4
+DRAW = 0
+ILLEGAL = 255
+MAX_PLIES = 253
+PIECE_ORDER = "QRBNP"  # * order of the pieces after the king in a table name
+PIECE_VALUE = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+# * tables every probe can answer without a file, nobody can mate
+DRAWN_MATERIAL = ("KK", "KBK", "KNK")
+DEFAULT_TABLES = ("KQK", "KRK", "KPK")
+
+
+# ? canonical table name of a list of (color, type) pieces and whether the colors have to be swapped for it
+# * the stronger side is always "white" in the table, black up a queen is looked up in KQK with the board flipped
+def materialName(pieces):
+    sides = {}
+    for color in "wb":
+        types = sorted((type for pieceColor, type in pieces if pieceColor == color and type != "K"),
+                       key=PIECE_ORDER.index)
+        sides[color] = "K" + "".join(types)
+    white = (sum(PIECE_VALUE[type] for type in sides["w"]), len(sides["w"]), sides["w"])
+    black = (sum(PIECE_VALUE[type] for type in sides["b"]), len(sides["b"]), sides["b"])
+    if black > white:
+        return sides["b"] + sides["w"], True
+    return sides["w"] + sides["b"], False
+
+
+# ? the (color, type) of every square index of a table, white king, black king, white pieces, black pieces
+def tablePieces(name):
+    split = name.index("K", 1)
+    return [("w", "K"), ("b", "K")] + [("w", type) for type in name[1:split]] + \
+        [("b", type) for type in name[split + 1:]]
+
+
+def positionIndex(squares, blackToMove):
+    index = blackToMove
+    for i, sq in enumerate(squares):
+        index |= sq << (6 * i + 1)
+    return index
+
+
+def attacks(type, color, sq, occupied):
+    if type == "N":
+        return KNIGHT_ATTACKS[sq]
+    if type == "K":
+        return KING_ATTACKS[sq]
+    if type == "P":
+        return PAWN_ATTACKS[color][sq]
+    if type == "R":
+        return rookAttacks(sq, occupied)
+    if type == "B":
+        return bishopAttacks(sq, occupied)
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+# * is square sq attacked by a piece of byColor, the piece at index skip (just captured) does not count
+def isAttacked(pieces, squares, sq, byColor, occupied, skip=-1):
+    for i, (color, type) in enumerate(pieces):
+        if color == byColor and i != skip and attacks(type, color, squares[i], occupied) >> sq & 1:
+            return True
+    return False
+
+
+# ? legal moves of color in a position: (piece index, target, captured index or -1, promotion type or None)
+def legalMoves(pieces, squares, color):
+    occupied = 0
+    own = 0
+    for i, (pieceColor, _) in enumerate(pieces):
+        occupied |= 1 << squares[i]
+        if pieceColor == color:
+            own |= 1 << squares[i]
+    enemy = "b" if color == "w" else "w"
+    kingSq = squares[0 if color == "w" else 1]
+    moves = []
+    for i, (pieceColor, type) in enumerate(pieces):
+        if pieceColor != color:
+            continue
+        sq = squares[i]
+        if type == "P":
+            step = -8 if color == "w" else 8
+            targets = PAWN_ATTACKS[color][sq] & occupied & ~own
+            if not occupied >> (sq + step) & 1:
+                targets |= 1 << (sq + step)
+                startRow = 6 if color == "w" else 1
+                if sq >> 3 == startRow and not occupied >> (sq + 2 * step) & 1:
+                    targets |= 1 << (sq + 2 * step)
+        else:
+            targets = attacks(type, color, sq, occupied) & ~own
+        while targets:
+            low = targets & -targets
+            target = low.bit_length() - 1
+            targets ^= low
+            captured = -1
+            if occupied & low:
+                captured = squares.index(target)
+            movedOccupied = (occupied & ~(1 << sq)) | low
+            newSquares = list(squares)
+            newSquares[i] = target
+            if isAttacked(pieces, newSquares, target if type == "K" else kingSq, enemy, movedOccupied, captured):
+                continue
+            if type == "P" and target >> 3 in (0, 7):
+                for promotion in "QRBN":
+                    moves.append((i, target, captured, promotion))
+            else:
+                moves.append((i, target, captured, None))
+    return moves
+
+
+# ? squares a piece of color on sq could have come from with a quiet move, for the backward search
+def unmoveSources(type, color, sq, occupied):
+    if type == "P":
+        step = 8 if color == "w" else -8  # * backwards
+        sources = []
+        behind = sq + step
+        if 0 <= behind < 64 and not occupied >> behind & 1 and behind >> 3 not in (0, 7):
+            sources.append(behind)
+            doubleRow = 4 if color == "w" else 3
+            if sq >> 3 == doubleRow and not occupied >> (behind + step) & 1:
+                sources.append(behind + step)
+        return sources
+    targets = attacks(type, color, sq, occupied) & ~occupied
+    sources = []
+    while targets:
+        low = targets & -targets
+        sources.append(low.bit_length() - 1)
+        targets ^= low
+    return sources
+
+
+# ? how good a move is for the side that made it, from the table byte of the position after it
+def moveRank(value):
+    if value == DRAW:
+        return 0
+    if (value - 1) % 2 == 0:  # * the opponent is lost: win, sooner is better
+        return 1000 - value
+    return -1000 + value  # * lost anyway, hold out the longest
+
+
+class Tablebases():
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}  # * name -> bytes like object (mmap of the file or a freshly generated bytearray)
+        self.files = []
+        self.missing = set()
+        self.names = set(self.available())  # * tables on disk when opened, a position without any is not scanned
+
+    def close(self):
+        for table in self.tables.values():
+            if isinstance(table, mmap.mmap):
+                table.close()
+        for file in self.files:
+            file.close()
+        self.tables = {}
+        self.files = []
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def getTable(self, name):
+        table = self.tables.get(name)
+        if table is None and name not in self.missing:
+            if not os.path.exists(self.path(name)):
+                self.missing.add(name)
+                return None
+            file = open(self.path(name), "rb")
+            self.files.append(file)
+            table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.tables[name] = table
+        return table
+
+    def available(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(fileName[:-3] for fileName in os.listdir(self.directory) if fileName.endswith(".tb"))
+
+    # ? table byte for a list of (color, type, square) pieces, None when there is no table for the material
+    def probePieces(self, placed, whiteToMove):
+        name, flip = materialName([(color, type) for color, type, _ in placed])
+        if name in DRAWN_MATERIAL:
+            return DRAW
+        table = self.getTable(name)
+        if table is None:
+            return None
+        if flip:  # * swap the colors and mirror the ranks, pawns then still walk the right way
+            placed = [("b" if color == "w" else "w", type, sq ^ 56) for color, type, sq in placed]
+            whiteToMove = not whiteToMove
+        squares = []
+        used = set()
+        for color, type in tablePieces(name):
+            for j, piece in enumerate(placed):
+                if j not in used and piece[0] == color and piece[1] == type:
+                    used.add(j)
+                    squares.append(piece[2])
+                    break
+        return table[positionIndex(squares, 0 if whiteToMove else 1)]
+
+    # ? table byte of a GameState, None if the position is not covered
+    # * castling rights and en passant are not in the tables
+    def probe(self, gs):
+        if not self.names:
+            return None
+        rights = gs.currentCasltingRight
+        if rights.wks or rights.wqs or rights.bks or rights.bqs:
+            return None
+        if gs.enpassantPossible != ():  # * only a problem when a pawn can actually take en passant
+            r, c = gs.enpassantPossible
+            row = r + 1 if gs.whiteToMove else r - 1
+            pawn = ("w" if gs.whiteToMove else "b") + "P"
+            if (c > 0 and gs.board[row][c - 1] == pawn) or (c < 7 and gs.board[row][c + 1] == pawn):
+                return None
+        placed = []
+        for r in range(8):
+            for c in range(8):
+                piece = gs.board[r][c]
+                if piece != "--":
+                    placed.append((piece[0], piece[1], r * 8 + c))
+                    if len(placed) > MAX_PIECES:
+                        return None
+        value = self.probePieces(placed, gs.whiteToMove)
+        return value if value != ILLEGAL else None
+
+    # ? the packed move that keeps the best tablebase result: fastest win, else a draw, else the slowest loss
+    def bestMove(self, gs):
+        best = None
+        bestRank = None
+        for move in gs.getLegalMoves():
+            gs.makePackedMove(move)
+            if len(gs.getLegalMoves()) == 0:
+                value = 1 if gs.checkMate else DRAW  # * mated right now is a loss in 0 plies
+            else:
+                value = self.probe(gs)
+            gs.undoMove()
+            if value is None:
+                return None
+            rank = moveRank(value)
+            if bestRank is None or rank > bestRank:
+                best, bestRank = move, rank
+        return best
+
+
+# ? retrograde analysis of one table, the smaller tables reached by captures and promotions must be in tablebases
+# * bucket queue by plies to mate: losses in n make their predecessors wins in n + 1, wins in n take one
+# * from the move counter of their predecessors, a predecessor with no move left is lost
+def generate(name, tablebases, out=sys.stdout):
+    chessBitboard.initSliderTables()
+    pieces = tablePieces(name)
+    count = len(pieces)
+    size = 1 << (6 * count + 1)
+    values = bytearray(size)
+    counters = bytearray(size)  # * quiet moves that stay in the table and are not known to lose yet
+    cannotLose = bytearray(size)  # * a move out of the table draws or wins
+    longestLoss = bytearray(size)  # * plies of the slowest loss through a move out of the table
+    buckets = [[] for _ in range(MAX_PLIES + 2)]
+    startTime = time.perf_counter()
+
+    def valid(squares, blackToMove):
+        if len(set(squares)) != count:
+            return False
+        for i, (color, type) in enumerate(pieces):
+            if type == "P" and squares[i] >> 3 in (0, 7):
+                return False
+        if KING_ATTACKS[squares[0]] >> squares[1] & 1:
+            return False
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        # * the side that just moved cannot be in check
+        waiting = "w" if blackToMove else "b"
+        return not isAttacked(pieces, squares, squares[0 if waiting == "w" else 1],
+                              "b" if waiting == "w" else "w", occupied)
+
+    # * first pass: legal positions, mates, stalemates and the moves leaving the table
+    for index in range(size):
+        blackToMove = index & 1
+        squares = [(index >> (6 * i + 1)) & 63 for i in range(count)]
+        if not valid(squares, blackToMove):
+            values[index] = ILLEGAL
+            continue
+    for index in range(size):
+        if values[index] == ILLEGAL:
+            continue
+        blackToMove = index & 1
+        color = "b" if blackToMove else "w"
+        squares = [(index >> (6 * i + 1)) & 63 for i in range(count)]
+        moves = legalMoves(pieces, squares, color)
+        if not moves:
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            kingSq = squares[1 if blackToMove else 0]
+            if isAttacked(pieces, squares, kingSq, "w" if blackToMove else "b", occupied):
+                buckets[0].append(index)  # * checkmate
+            else:
+                cannotLose[index] = 1  # * stalemate stays a draw
+            continue
+        quiet = 0
+        bestWin = None
+        for i, target, captured, promotion in moves:
+            if captured == -1 and promotion is None:
+                quiet += 1
+                continue
+            placed = [(pieceColor, promotion if j == i and promotion else type, target if j == i else squares[j])
+                      for j, (pieceColor, type) in enumerate(pieces) if j != captured]
+            child = tablebases.probePieces(placed, blackToMove == 1)
+            if child is None:
+                raise ValueError(name + " needs the table for " + materialName([p[:2] for p in placed])[0])
+            if child == DRAW:
+                cannotLose[index] = 1
+            elif (child - 1) % 2 == 0:  # * the opponent loses in child - 1 plies
+                if bestWin is None or child < bestWin:
+                    bestWin = child
+            else:
+                longestLoss[index] = max(longestLoss[index], child)  # * child - 1 plies, plus this move
+        counters[index] = quiet
+        if bestWin is not None:
+            buckets[bestWin].append(index)
+            cannotLose[index] = 1  # * never a loss, even when every quiet move turns out to lose
+        elif quiet == 0 and not cannotLose[index]:
+            buckets[longestLoss[index]].append(index)
+
+    # * second pass: walk the buckets in order of plies, resolving positions and their predecessors
+    for plies in range(MAX_PLIES + 1):
+        for index in buckets[plies]:
+            if values[index] != 0:
+                continue
+            values[index] = plies + 1
+            blackToMove = index & 1
+            mover = "w" if blackToMove else "b"  # * the side that made the move into this position
+            squares = [(index >> (6 * i + 1)) & 63 for i in range(count)]
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            for i, (color, type) in enumerate(pieces):
+                if color != mover:
+                    continue
+                for source in unmoveSources(type, color, squares[i], occupied):
+                    previous = (index ^ 1) & ~(63 << (6 * i + 1)) | source << (6 * i + 1)
+                    if values[previous] != 0:
+                        continue  # * illegal or already resolved
+                    if plies % 2 == 0:  # * this position is lost, so the predecessor wins
+                        buckets[plies + 1].append(previous)
+                    else:
+                        counters[previous] -= 1
+                        if counters[previous] == 0 and not cannotLose[previous]:
+                            buckets[max(plies + 1, longestLoss[previous])].append(previous)
+        buckets[plies] = None
+    if out is not None:
+        print(name + ": " + str(size) + " positions in " + str(round(time.perf_counter() - startTime, 1)) + "s",
+              file=out)
+    return values
+
+
+# ? generate the tables (and the smaller ones they need) and write them to directory
+def generateTables(names, directory=TABLEBASE_DIR, out=sys.stdout):
+    os.makedirs(directory, exist_ok=True)
+    tablebases = Tablebases(directory)
+    done = set(tablebases.available())
+
+    def build(name):
+        if name in done or name in DRAWN_MATERIAL:
+            return
+        # * every capture or promotion leads to a smaller table, make those first
+        pieces = tablePieces(name)
+        for i, (color, type) in enumerate(pieces):
+            if type != "K":
+                build(materialName(pieces[:i] + pieces[i + 1:])[0])
+            if type == "P":
+                for promotion in "QRBN":
+                    build(materialName(pieces[:i] + [(color, promotion)] + pieces[i + 1:])[0])
+        values = generate(name, tablebases, out)
+        with open(tablebases.path(name), "wb") as tableFile:
+            tableFile.write(values)
+        tablebases.tables[name] = values
+        done.add(name)
+
+    for name in names:
+        if len(tablePieces(name)) > MAX_PIECES:
+            raise ValueError("only tables up to " + str(MAX_PIECES) + " pieces: " + name)
+        build(materialName(tablePieces(name))[0])
+    tablebases.close()
+
+
+# ? table byte of a GameState from a full width search depth plies deep, the positions at the end are probed
+# * mates and stalemates come from the engine's own move generation, not from the tables
+def searchValue(gs, tablebases, depth):
+    if depth == 0:
+        return tablebases.probe(gs)
+    best = None
+    bestRank = None
+    for move in gs.getLegalMoves():
+        gs.makePackedMove(move)
+        value = searchValue(gs, tablebases, depth - 1)
+        gs.undoMove()
+        if value is None:
+            return None
+        rank = moveRank(value)
+        if bestRank is None or rank > bestRank:
+            best, bestRank = value, rank
+    if best is None:
+        return 1 if gs.checkMate else DRAW
+    return DRAW if best == DRAW else best + 1
+
+
+# ? compare samples random positions of a generated table with a search over the engine's legal moves
+# * returns the number of mismatches, the search only trusts the table depth plies further down
+def verify(name, tablebases, samples=1000, depth=1, seed=0, out=sys.stdout):
+    import random
+    import ChessEngine
+    pieces = tablePieces(name)
+    table = tablebases.getTable(name)
+    if table is None:
+        raise ValueError("no table for " + name)
+    rng = random.Random(seed)
+    mismatches = 0
+    checked = 0
+    while checked < samples:
+        index = rng.randrange(len(table))
+        if table[index] == ILLEGAL:
+            continue
+        checked += 1
+        board = [["--"] * 8 for _ in range(8)]
+        for i, (color, type) in enumerate(pieces):
+            sq = (index >> (6 * i + 1)) & 63
+            board[sq >> 3][sq & 7] = color + type
+        rows = []
+        for row in board:
+            text = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                text += (str(empty) if empty else "") + (piece[1] if piece[0] == "w" else piece[1].lower())
+                empty = 0
+            rows.append(text + (str(empty) if empty else ""))
+        fen = "/".join(rows) + (" b" if index & 1 else " w") + " - - 0 1"
+        gs = ChessEngine.GameState.fromFen(fen)
+        expected = searchValue(gs, tablebases, depth)
+        if expected != table[index]:
+            mismatches += 1
+            if out is not None:
+                print(fen + ": table " + describe(table[index]) + ", search " + describe(expected), file=out)
+    if out is not None:
+        print(name + ": " + str(checked) + " positions, " + str(mismatches) + " mismatches", file=out)
+    return mismatches
+
+
+def describe(value):
+    if value is None:
+        return "not in the tablebases"
+    if value == DRAW:
+        return "draw"
+    plies = value - 1
+    if plies % 2:
+        return "win, mate in " + str((plies + 1) // 2)
+    return "loss, mated in " + str(plies // 2)
+
+
+def main(argv=None):
+    import ChessEngine
+    parser = argparse.ArgumentParser(description="generate or probe endgame tablebases")
+    parser.add_argument("command", choices=("generate", "probe", "verify"))
+    parser.add_argument("tables", nargs="*", help="generate / verify: table names like KQK KRK KPK KQKR")
+    parser.add_argument("--dir", default=TABLEBASE_DIR)
+    parser.add_argument("--fen", default=None)
+    parser.add_argument("--samples", type=int, default=1000, help="verify: positions checked per table")
+    parser.add_argument("--depth", type=int, default=1, help="verify: plies searched before probing")
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generateTables(args.tables or DEFAULT_TABLES, args.dir)
+        return 0
+    if args.command == "verify":
+        tablebases = Tablebases(args.dir)
+        mismatches = sum(verify(name, tablebases, args.samples, args.depth)
+                         for name in (args.tables or tablebases.available()))
+        tablebases.close()
+        return 1 if mismatches else 0
+    gs = ChessEngine.GameState.fromFen(args.fen)
+    tablebases = Tablebases(args.dir)
+    print(describe(tablebases.probe(gs)))
+    move = tablebases.bestMove(gs)
+    if move is not None:
+        print("best " + getPackedNotation(move))
+    tablebases.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
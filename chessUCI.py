@@ -0,0 +1,269 @@
+
+# ? UCI front end: read commands on stdin, answer on stdout, so the engine runs under any UCI GUI or match runner
+# ? the search runs on a thread so stop / ponderhit are read while it thinks,
+# ? with Threads > 1 the root moves go to chessParallel worker processes
+# * python chessUCI.py
+
+import os
+import sys
+import threading
+import time
+import chessAI
+import chessBitboard
+import chessParallel
+from ChessEngine import START_FEN, getPackedNotation
+from chessAI import CHECKMATE, MAX_PLY
+
+ENGINE_NAME = "Chess-Engine"
+ENGINE_AUTHOR = "sergi-s"
+GAME_STATE = chessBitboard.BitboardGameState
+MOVE_OVERHEAD = 0.05  # * seconds kept back for the GUI and the pipe
+MOVES_TO_GO = 30  # * moves left to plan for when the time control does not say
+
+
+# ? score in UCI terms: "cp 35" or "mate 3" (negative when getting mated)
+def uciScore(score):
+    if score > CHECKMATE - MAX_PLY:
+        return "mate " + str((CHECKMATE - score + 1) // 2)
+    if score < -CHECKMATE + MAX_PLY:
+        return "mate " + str(-((CHECKMATE + score) // 2))
+    return "cp " + str(score)
+
+
+# ? (soft, hard) seconds for this move from the go arguments, None for no limit
+# * iterations are only started before the soft limit, the hard one stops the search wherever it is
+def allocateTime(go, whiteToMove):
+    if "movetime" in go:
+        limit = max(0.01, go["movetime"] / 1000 - MOVE_OVERHEAD)
+        return limit, limit
+    left = go.get("wtime" if whiteToMove else "btime")
+    if left is None:
+        return None, None
+    increment = go.get("winc" if whiteToMove else "binc", 0)
+    movesToGo = go.get("movestogo", MOVES_TO_GO)
+    soft = (left / max(1, movesToGo) + increment * 3 / 4) / 1000
+    hard = min(soft * 4, left / 1000 / 2)
+    soft = min(soft, hard)
+    return max(0.01, soft - MOVE_OVERHEAD), max(0.01, hard - MOVE_OVERHEAD)
+
+
+class UCIEngine():
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.outputLock = threading.Lock()
+        self.gs = GAME_STATE()
+        self.hashMB = chessAI.TT_SIZE_MB
+        self.threads = 1
+        self.ponderEnabled = False
+        self.ownBook = False
+        self.searcher = None
+        self.thread = None
+        self.stopEvent = threading.Event()
+        self.pondering = False
+        self.infinite = False
+        self.hardDeadline = None
+        self.softDeadline = None
+        self.pendingTime = (None, None)  # * time for the move, used once a ponder search is hit
+
+    def send(self, line):
+        with self.outputLock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def getSearcher(self):
+        if self.searcher is None:
+            if self.threads > 1:
+                self.searcher = chessParallel.ParallelSearcher(self.threads, self.hashMB)
+            else:
+                self.searcher = chessAI.Searcher(chessAI.transpositionTable)
+        return self.searcher
+
+    def resetSearcher(self):
+        self.stop()
+        if isinstance(self.searcher, chessParallel.ParallelSearcher):
+            self.searcher.close()
+        self.searcher = None
+
+    # ? handle one line of input, returns False on quit
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default " + str(chessAI.TT_SIZE_MB) + " min 1 max 4096")
+            self.send("option name Threads type spin default 1 min 1 max " + str(os.cpu_count() or 1))
+            self.send("option name Ponder type check default false")
+            self.send("option name OwnBook type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(tokens)
+        elif command == "ucinewgame":
+            self.stop()
+            chessAI.transpositionTable.clear()
+            if isinstance(self.searcher, chessParallel.ParallelSearcher):
+                self.searcher.clear()
+            self.gs = GAME_STATE()
+        elif command == "position":
+            self.stop()
+            self.setPosition(tokens)
+        elif command == "go":
+            self.go(tokens)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command == "quit":
+            self.stop()
+            self.resetSearcher()
+            return False
+        elif command == "d":  # * not UCI, handy when testing by hand
+            self.send(self.gs.toFen())
+        return True
+
+    def setOption(self, tokens):
+        if "name" not in tokens:
+            return
+        valueAt = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[tokens.index("name") + 1:valueAt]).lower()
+        value = " ".join(tokens[valueAt + 1:])
+        if name in ("hash", "threads"):
+            try:
+                number = max(1, int(value))
+            except ValueError:
+                self.send("info string bad value for " + name + ": " + value)
+                return
+        if name == "hash":
+            self.hashMB = number
+            chessAI.transpositionTable.resize(self.hashMB)
+            self.resetSearcher()
+        elif name == "threads":
+            self.threads = number
+            self.resetSearcher()
+        elif name == "ponder":
+            self.ponderEnabled = value.lower() == "true"
+        elif name == "ownbook":
+            self.ownBook = value.lower() == "true"
+
+    # * position startpos [moves e2e4 ...] or position fen <fen> [moves ...]
+    def setPosition(self, tokens):
+        movesAt = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if len(tokens) > 1 and tokens[1] == "fen":
+            fen = " ".join(tokens[2:movesAt])
+        else:
+            fen = START_FEN
+        try:
+            gs = GAME_STATE.fromFen(fen)
+        except ValueError as e:
+            self.send("info string " + str(e))
+            return
+        for notation in tokens[movesAt + 1:]:
+            for move in gs.getLegalMoves():
+                if getPackedNotation(move) == notation:
+                    gs.makePackedMove(move)
+                    break
+            else:
+                self.send("info string illegal move " + notation)
+                break
+        self.gs = gs
+
+    def go(self, tokens):
+        self.stop()
+        if self.ownBook and "ponder" not in tokens and "infinite" not in tokens:
+            bookMove = chessAI.findBookMove(self.gs)
+            if bookMove is not None:
+                self.send("bestmove " + getPackedNotation(bookMove))
+                return
+        go = {}
+        for i, token in enumerate(tokens):
+            if token in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes", "mate") and \
+                    i + 1 < len(tokens):
+                try:
+                    go[token] = int(tokens[i + 1])
+                except ValueError:
+                    self.send("info string bad value for " + token + ": " + tokens[i + 1])
+                    return
+        self.pondering = "ponder" in tokens
+        self.infinite = "infinite" in tokens
+        soft, hard = allocateTime(go, self.gs.whiteToMove)
+        self.pendingTime = (soft, hard)
+        if self.pondering or self.infinite:
+            soft = hard = None
+        now = time.perf_counter()
+        self.softDeadline = now + soft if soft is not None else None
+        self.hardDeadline = now + hard if hard is not None else None
+        depth = go.get("depth", MAX_PLY - 1)
+        if "mate" in go:
+            depth = min(depth, 2 * go["mate"])
+        self.stopEvent.clear()
+        # * the worker processes are forked here, before the search thread exists
+        searcher = self.getSearcher()
+        # * position and go both stop a running search first, so the thread has gs to itself
+        self.thread = threading.Thread(target=self.search, args=(searcher, self.gs, depth, go.get("nodes")),
+                                       daemon=True)
+        self.thread.start()
+
+    def shouldStop(self):
+        return self.stopEvent.is_set() or \
+            (self.hardDeadline is not None and time.perf_counter() >= self.hardDeadline)
+
+    def onIteration(self, result):
+        elapsed = max(result.elapsed, 1e-6)
+        hashfull = chessAI.transpositionTable.hashfull() if isinstance(self.searcher, chessAI.Searcher) else 0
+        self.send("info depth " + str(result.depth) + " score " + uciScore(result.score) + " nodes " +
+                  str(result.nodes) + " nps " + str(int(result.nodes / elapsed)) + " time " +
+                  str(int(elapsed * 1000)) + " hashfull " + str(hashfull) + " pv " +
+                  " ".join(getPackedNotation(move) for move in result.pv))
+        # * past the soft limit a new iteration would not finish, stop instead of starting it
+        if self.softDeadline is not None and time.perf_counter() >= self.softDeadline:
+            self.stopEvent.set()
+
+    def search(self, searcher, gs, depth, nodeLimit):
+        searcher.shouldStop = self.shouldStop
+        searcher.onIteration = self.onIteration
+        result = searcher.think(gs, depth, None, nodeLimit)
+        # * while pondering or on go infinite the answer waits for stop or ponderhit
+        while (self.pondering or self.infinite) and not self.stopEvent.is_set():
+            self.stopEvent.wait(0.01)
+        if result.move is None:
+            self.send("bestmove 0000")
+            return
+        line = "bestmove " + getPackedNotation(result.move)
+        if len(result.pv) > 1:
+            line += " ponder " + getPackedNotation(result.pv[1])
+        self.send(line)
+
+    # ? the opponent played the pondered move: keep searching, now against the clock
+    def ponderHit(self):
+        if self.thread is None or not self.pondering:
+            return
+        soft, hard = self.pendingTime
+        now = time.perf_counter()
+        self.softDeadline = now + soft if soft is not None else None
+        self.hardDeadline = now + hard if hard is not None else None
+        self.pondering = False  # * a search that already finished sends its bestmove now
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopEvent.set()
+            self.thread.join()
+            self.thread = None
+        self.pondering = False
+        self.infinite = False
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+    engine.resetSearcher()
+
+
+if __name__ == "__main__":
+    main()